@@ -12,7 +12,7 @@ import {
 
 import ReadMore from "@/components/products/ReadMore";
 
-import { getLatestProducts, getProduct } from "@/lib/data";
+import { getLatestProducts, getProduct, getProductPriceHistory } from "@/lib/data";
 import {
   calculate_product_variant_prices,
   groupVariantsByStore,
@@ -64,6 +64,8 @@ export default async function ProductPage(
     notFound();
   }
   const product = result.data;
+  const priceHistoryResult = await getProductPriceHistory(parent_slug);
+  const priceHistory = priceHistoryResult.success ? priceHistoryResult.data : [];
 
   return (
     <div className="max-w-7xl mx-auto px-4 sm:px-6 lg:px-8 py-8 md:py-12">
@@ -207,7 +209,7 @@ export default async function ProductPage(
           <TrendingUp className="w-8 h-8 text-purple-500" /> Ценови графики
         </h2>
         <PriceHistoryChart
-          variants={product.variants}
+          priceHistory={priceHistory}
         />
         <div className="mt-8">
           <PriceDistributionByStoreChart variants={product.variants} />
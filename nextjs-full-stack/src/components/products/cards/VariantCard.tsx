@@ -113,10 +113,9 @@ export default function VariantCard({
         {variants.map((variant) => {
           const isSelectedByShare = selectedVariantSlug === variant.slug;
           const isAvailable = variant.availability === "В наличност";
-          const latestPriceRecord =
-            variant.price_history[variant.price_history.length - 1];
+          const latestPriceRecord = variant.latest_lowest_price_record;
           const { price_bgn, price_eur } = calculate_product_variant_prices(
-            latestPriceRecord?.price
+            latestPriceRecord?.price ?? 0
           );
 
           const compareItemIds = new Set(
@@ -55,7 +55,7 @@ export default function PriceDistributionByStoreChart({
     const aggregatedData = Object.entries(variantsByStore).reduce(
       (acc, [store, storeVariants]) => {
         const prices = storeVariants
-          .map((variant) => variant.price_history[variant.price_history.length - 1].price)
+          .map((variant) => variant.latest_lowest_price_record?.price)
           .filter(
             (price): price is number =>
               typeof price === "number" && isFinite(price)
@@ -21,7 +21,7 @@ import {
   calculate_product_variant_prices,
   getPriceHistoryChartData,
 } from "@/lib/utils";
-import { ProductVariant } from "@/lib/validations/product";
+import { VariantPriceHistory } from "@/lib/validations/product";
 import Link from "next/link";
 import { useAuth } from "@clerk/nextjs";
 
@@ -41,12 +41,12 @@ const chartConfig = {
 } satisfies ChartConfig;
 
 type PriceHistoryChartProps = {
-  variants: ProductVariant[];
+  priceHistory: VariantPriceHistory[];
 };
 
   
 export default function PriceHistoryChart({
-  variants,
+  priceHistory,
 }: PriceHistoryChartProps) {
   const { has, isSignedIn } = useAuth();
 
@@ -55,7 +55,7 @@ export default function PriceHistoryChart({
       ? has({ feature: "7_dnevna_istoriya_na_tsenite_na_produktite" })
       : false;
   const chartData = useMemo(() => {
-    const fullChartData = getPriceHistoryChartData(variants);
+    const fullChartData = getPriceHistoryChartData(priceHistory);
     // if the user has basic price history access, filter chart data for the last 7 days only.
     if (has_basic_price_history_access) {
       const sevenDaysAgo = new Date();
@@ -67,7 +67,7 @@ export default function PriceHistoryChart({
       });
     }
     return fullChartData;
-  }, [variants, has_basic_price_history_access]);
+  }, [priceHistory, has_basic_price_history_access]);
 
   const yAxisTicks = useMemo(() => {
     if (chartData.length < 2) return [];
@@ -47,8 +47,7 @@ export default function SelectVariantForCompareModal({
         <div className="mt-4 space-y-2 max-h-[60vh] overflow-y-auto pr-2">
           {variants.length > 0 ? (
             variants.map((variant) => {
-              const latestPrice =
-                variant.price_history[variant.price_history.length - 1]?.price;
+              const latestPrice = variant.latest_lowest_price_record?.price ?? 0;
               const { price_bgn, price_eur } =
                 calculate_product_variant_prices(latestPrice);
               const compareItemIds = new Set(
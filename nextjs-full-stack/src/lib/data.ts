@@ -8,6 +8,9 @@ import {
   CategoriesResponseSchema,
   Category,
   SearchApiResponseSchema,
+  PriceHistorySeriesSchema,
+  PriceHistoryResolution,
+  VariantPriceHistory,
 } from "@/lib/validations/product";
 import { cache } from "react";
 import { SpecialSearchFormValues } from "./validations/form";
@@ -110,6 +113,58 @@ export const getProduct = cache(
   }
 );
 
+export const getProductPriceHistory = cache(
+  async (
+    slug: string,
+    resolution: PriceHistoryResolution = "daily"
+  ): Promise<DataResponse<VariantPriceHistory[]>> => {
+    try {
+      const response = await fetch(
+        `${API_BASE}/api/product/${slug}/price-history?resolution=${resolution}`
+      );
+
+      if (!response.ok) {
+        const errorText = await response.text();
+        console.error(
+          `Failed to fetch price history of product ${slug}:`,
+          response.status,
+          errorText
+        );
+        return {
+          success: false,
+          error: `Неуспешно извличане на историята на цените за продукт ${slug}. Сървърът отговори със статус ${response.status}.`,
+        };
+      }
+
+      const rawData: unknown = await response.json();
+
+      const result = PriceHistorySeriesSchema.safeParse(rawData);
+
+      if (!result.success) {
+        console.error(
+          "Validation Error: The price history data is malformed.",
+          result.error
+        );
+        return {
+          success: false,
+          error: "Получени са неправилно форматирани данни от сървъра.",
+        };
+      }
+
+      return { success: true, data: result.data.variants };
+    } catch (err) {
+      console.error(
+        "Мрежова или неочаквана грешка при извличане на историята на цените.",
+        err
+      );
+      if (err instanceof Error) {
+        return { success: false, error: err.message };
+      }
+      return { success: false, error: "Възникна неизвестна грешка." };
+    }
+  }
+);
+
 export default async function getComparisonProductData(
   ids: number[]
 ): Promise<DataResponse<ComparisonProduct[]>> {
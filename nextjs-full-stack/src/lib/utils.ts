@@ -1,4 +1,4 @@
-import { ProductVariant } from "@/lib/validations/product";
+import { ProductVariant, VariantPriceHistory } from "@/lib/validations/product";
 import { clsx, type ClassValue } from "clsx";
 import { twMerge } from "tailwind-merge";
 import slugify from "slugify";
@@ -51,8 +51,7 @@ export function getVariantSummary(variants: ProductVariant[]) {
         acc.availableCount++;
       }
       // find min/max price
-      const latest_price_record =
-        variant.price_history[variant.price_history.length - 1];
+      const latest_price_record = variant.latest_lowest_price_record;
       if (latest_price_record) {
         const priceNum = latest_price_record.price;
         if (!isNaN(priceNum)) {
@@ -76,19 +75,23 @@ export function getVariantSummary(variants: ProductVariant[]) {
   return { ...summary, totalCount: variants.length };
 }
 
-export const getPriceHistoryChartData = (variants: ProductVariant[]) => {
+export const getPriceHistoryChartData = (variants: VariantPriceHistory[]) => {
   if (!variants || variants.length === 0) {
     return [];
   }
 
   // collect all price points into a single array and find the earliest date.
+  // each bucket contributes the last price recorded in it
   let minDate = new Date();
   const allPricePoints = variants.flatMap((variant) =>
-    variant.price_history.map((p) => ({
-      ...p,
-      recorded_at: new Date(p.recorded_at),
+    variant.points.map((p) => ({
+      price: p.last_price,
+      recorded_at: new Date(p.bucket_start),
     }))
   );
+  if (allPricePoints.length === 0) {
+    return [];
+  }
 
   minDate = new Date(
     Math.min(...allPricePoints.map((p) => p.recorded_at.getTime()))
@@ -97,10 +100,9 @@ export const getPriceHistoryChartData = (variants: ProductVariant[]) => {
   maxDate.setHours(23, 59, 59, 999);
 
   const variantPriceHistories = variants.map((variant) => ({
-    ...variant,
-    price_history: variant.price_history.sort(
-      (a, b) => a.recorded_at.getTime() - b.recorded_at.getTime()
-    ),
+    price_history: variant.points
+      .map((p) => ({ price: p.last_price, recorded_at: new Date(p.bucket_start) }))
+      .sort((a, b) => a.recorded_at.getTime() - b.recorded_at.getTime()),
   }));
 
   const dailySnapshots = new Map<string, number[]>();
@@ -27,7 +27,28 @@ export const ProductVariantSchema = z.object({
   variant_specs: z.record(z.string(), z.any()),
   created_at: z.coerce.date(),
   last_scraped_at: z.coerce.date(),
-  price_history: z.array(PriceHistorySchema),
+  latest_lowest_price_record: PriceHistorySchema.nullable(),
+});
+
+// daily or weekly price buckets of every variant, served by /api/product/{slug}/price-history
+export const PriceHistoryResolutionSchema = z.enum(["daily", "weekly"]);
+
+export const PriceHistoryPointSchema = z.object({
+  bucket_start: z.coerce.date(),
+  min_price: z.number(),
+  max_price: z.number(),
+  last_price: z.number(),
+  currency: CURRENCY_SCHEMA,
+});
+
+export const VariantPriceHistorySchema = z.object({
+  variant_id: ID_SCHEMA,
+  points: z.array(PriceHistoryPointSchema),
+});
+
+export const PriceHistorySeriesSchema = z.object({
+  resolution: PriceHistoryResolutionSchema,
+  variants: z.array(VariantPriceHistorySchema),
 });
 
 export const ProductSchema = z.object({
@@ -114,6 +135,9 @@ export const SearchApiResponseSchema = z.object({
 
 export type PriceHistory = z.infer<typeof PriceHistorySchema>;
 export type ProductVariant = z.infer<typeof ProductVariantSchema>;
+export type PriceHistoryResolution = z.infer<typeof PriceHistoryResolutionSchema>;
+export type VariantPriceHistory = z.infer<typeof VariantPriceHistorySchema>;
+export type PriceHistorySeries = z.infer<typeof PriceHistorySeriesSchema>;
 export type Product = z.infer<typeof ProductSchema>;
 export type ProductPreview = z.infer<typeof ProductPreviewCardSchema>;
 export type ComparisonProduct = z.infer<typeof ComparisonProductSchema>;
@@ -0,0 +1,134 @@
+"""
+Benchmark for the ways of loading each variant's current price record, on a seeded 1M-row price_history.
+
+It seeds a separate `price_loader_benchmark` schema in the configured database (DB_* environment variables),
+so the application tables are left untouched, and drops it afterwards.
+
+Run from the python-backend directory:
+    python -m benchmarks.price_loader_benchmark
+"""
+import time
+
+from sqlalchemy import text
+
+from db.helpers import engine
+
+BENCHMARK_SCHEMA = "price_loader_benchmark"
+VARIANT_COUNT = 20_000
+PRICE_RECORDS_PER_VARIANT = 50
+# a listing page (12 products with ~3 variants each) and a large analysis result
+BATCH_SIZES = [36, 1000]
+ROUNDS = 20
+
+# the SQL emitted by selectinload for each loading strategy
+LOADERS = {
+    "correlated subquery (previous)": """
+        SELECT pv.id, ph.id, ph.price, ph.currency, ph.recorded_at
+        FROM product_variants AS pv
+        JOIN price_history AS ph ON pv.id = ph.variant_id AND ph.id = (
+            SELECT latest.id FROM price_history AS latest
+            WHERE latest.variant_id = pv.id
+            ORDER BY latest.recorded_at DESC
+            LIMIT 1
+        )
+        WHERE pv.id = ANY(:variant_ids)
+    """,
+    "DISTINCT ON batch": """
+        SELECT DISTINCT ON (ph.variant_id) ph.variant_id, ph.id, ph.price, ph.currency, ph.recorded_at
+        FROM price_history AS ph
+        WHERE ph.variant_id = ANY(:variant_ids)
+        ORDER BY ph.variant_id, ph.recorded_at DESC
+    """,
+    "LATERAL batch": """
+        SELECT v.id, latest.id, latest.price, latest.currency, latest.recorded_at
+        FROM unnest(CAST(:variant_ids AS integer[])) AS v(id)
+        CROSS JOIN LATERAL (
+            SELECT ph.id, ph.price, ph.currency, ph.recorded_at FROM price_history AS ph
+            WHERE ph.variant_id = v.id
+            ORDER BY ph.recorded_at DESC
+            LIMIT 1
+        ) AS latest
+    """,
+    # the pointers come with the variant rows the loader starts from, so only the primary key lookup remains
+    "maintained pointer (current)": """
+        SELECT ph.id, ph.price, ph.currency, ph.recorded_at
+        FROM price_history AS ph
+        WHERE ph.id = ANY(:record_ids)
+    """,
+}
+
+def seed(connection) -> None:
+    """Creates the benchmark tables with the same columns and indexes as the application's."""
+    print(f"Seeding {VARIANT_COUNT * PRICE_RECORDS_PER_VARIANT:,} price records for {VARIANT_COUNT:,} variants...")
+    connection.execute(text(f"DROP SCHEMA IF EXISTS {BENCHMARK_SCHEMA} CASCADE"))
+    connection.execute(text(f"CREATE SCHEMA {BENCHMARK_SCHEMA}"))
+    connection.execute(text(f"SET search_path TO {BENCHMARK_SCHEMA}"))
+    connection.execute(text("CREATE TABLE product_variants (id integer PRIMARY KEY, current_price_record_id integer)"))
+    connection.execute(text("""
+        CREATE TABLE price_history (
+            id serial PRIMARY KEY,
+            variant_id integer NOT NULL,
+            price numeric(10, 2) NOT NULL,
+            currency varchar(3) NOT NULL DEFAULT 'BGN',
+            recorded_at timestamptz NOT NULL
+        )
+    """))
+    connection.execute(text("""
+        INSERT INTO price_history (variant_id, price, recorded_at)
+        SELECT variant_id, round((random() * 2000)::numeric, 2), now() - make_interval(days => record_number)
+        FROM generate_series(1, :variant_count) AS variant_id
+        CROSS JOIN generate_series(1, :records_per_variant) AS record_number
+        ORDER BY random()
+    """), {"variant_count": VARIANT_COUNT, "records_per_variant": PRICE_RECORDS_PER_VARIANT})
+    connection.execute(text("CREATE INDEX ON price_history (variant_id)"))
+    connection.execute(text("""
+        INSERT INTO product_variants (id, current_price_record_id)
+        SELECT DISTINCT ON (variant_id) variant_id, id
+        FROM price_history
+        ORDER BY variant_id, recorded_at DESC
+    """))
+    connection.execute(text("ANALYZE"))
+
+def time_loader(connection, sql: str, variant_ids: list[int], record_ids: list[int]) -> float:
+    """Returns the best time of a loader in milliseconds."""
+    best = float("inf")
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        connection.execute(text(sql), {"variant_ids": variant_ids, "record_ids": record_ids}).all()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def run_loaders(connection, title: str) -> None:
+    print(f"\n{title}")
+    print(f"{'loader':>32} | " + " | ".join(f"{size:>6} variants" for size in BATCH_SIZES))
+    batches = []
+    for size in BATCH_SIZES:
+        variant_ids = list(range(1, VARIANT_COUNT + 1, VARIANT_COUNT // size))[:size]
+        record_ids = connection.execute(
+            text("SELECT current_price_record_id FROM product_variants WHERE id = ANY(:variant_ids)"),
+            {"variant_ids": variant_ids},
+        ).scalars().all()
+        batches.append((variant_ids, record_ids))
+
+    for name, sql in LOADERS.items():
+        timings = [time_loader(connection, sql, variant_ids, record_ids) for variant_ids, record_ids in batches]
+        print(f"{name:>32} | " + " | ".join(f"{timing:>11.2f} ms" for timing in timings))
+
+def run_benchmark():
+    with engine.connect() as connection:
+        try:
+            seed(connection)
+            connection.commit()
+            run_loaders(connection, "Indexes: price_history (variant_id)")
+
+            connection.execute(text("CREATE INDEX ON price_history (variant_id, recorded_at DESC)"))
+            connection.execute(text("ANALYZE price_history"))
+            connection.commit()
+            run_loaders(connection, "Indexes: price_history (variant_id), (variant_id, recorded_at DESC)")
+        finally:
+            connection.rollback()
+            connection.execute(text(f"DROP SCHEMA IF EXISTS {BENCHMARK_SCHEMA} CASCADE"))
+            connection.commit()
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,86 @@
+"""
+Micro-benchmark for the product serialization paths used by update_task_status and the REST endpoints.
+
+Run from the python-backend directory:
+    python -m benchmarks.serialization_benchmark
+"""
+import time
+from decimal import Decimal
+from types import SimpleNamespace
+
+from fastapi.encoders import jsonable_encoder
+
+from configs.pydantic_models import ProductSchema
+from helpers.serializers import serialize_task_products, product_list_adapter
+from helpers.utils import calculate_matching_variants
+
+PRODUCT_COUNTS = [10, 100, 1000]
+VARIANTS_PER_PRODUCT = 3
+USER_FILTERS = {"Цена": "100-2000", "RAM памет": "8GB"}
+
+def build_fake_products(count: int) -> list[SimpleNamespace]:
+    """Builds objects shaped like the ORM products loaded by read_products_from_db."""
+    products = []
+    for product_id in range(1, count + 1):
+        variants = []
+        for variant_number in range(VARIANTS_PER_PRODUCT):
+            variant_id = product_id * VARIANTS_PER_PRODUCT + variant_number
+            variants.append(SimpleNamespace(
+                id=variant_id,
+                product_id=product_id,
+                source_url=f"https://www.example.bg/product-{variant_id}",
+                image_url=f"https://www.example.bg/images/{variant_id}.jpg",
+                availability="В наличност",
+                variant_specs={"ram": f"{8 * (variant_number + 1)}GB", "color": "черен"},
+                latest_lowest_price_record=SimpleNamespace(price=Decimal("999.90") + variant_number, currency="BGN"),
+            ))
+        products.append(SimpleNamespace(
+            id=product_id,
+            name=f"Продукт {product_id}",
+            slug=f"produkt-{product_id}",
+            category="Смартфони",
+            common_specs={"brand": "Example", "screen_size": "6.1"},
+            variants=variants,
+        ))
+    return products
+
+def serialize_per_object(products: list[SimpleNamespace]) -> list[dict[str, any]]:
+    """The previous path: one model_validate per product followed by jsonable_encoder."""
+    validated_products = []
+    for product_model in products:
+        product_schema = ProductSchema.model_validate(product_model)
+        user_filters = {name: value for name, value in USER_FILTERS.items()}
+        count, urls = calculate_matching_variants(product_model, user_filters)
+        product_schema.CRAWLEEBOT_matchingVariantCount = count
+        product_schema.CRAWLEEBOT_matchingVariantUrls = urls
+        validated_products.append(product_schema)
+    return jsonable_encoder(validated_products)
+
+def serialize_batch_bytes(products: list[SimpleNamespace]) -> bytes:
+    """The REST path: one batched validation straight to JSON bytes."""
+    return product_list_adapter.dump_json(product_list_adapter.validate_python(products, from_attributes=True))
+
+def time_per_product(func, products: list[SimpleNamespace], rounds: int) -> float:
+    """Returns the best average time per product in microseconds."""
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func(products)
+        best = min(best, time.perf_counter() - start)
+    return best / len(products) * 1_000_000
+
+def run_benchmark():
+    paths = {
+        "per-object + jsonable_encoder": serialize_per_object,
+        "batched TypeAdapter (dicts)": lambda products: serialize_task_products(products, USER_FILTERS),
+        "batched TypeAdapter (JSON bytes)": serialize_batch_bytes,
+    }
+    print(f"{'products':>8} | " + " | ".join(f"{name:>32}" for name in paths))
+    for count in PRODUCT_COUNTS:
+        products = build_fake_products(count)
+        rounds = max(3, 3000 // count)
+        timings = [time_per_product(func, products, rounds) for func in paths.values()]
+        print(f"{count:>8} | " + " | ".join(f"{timing:>29.1f} µs" for timing in timings))
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field, StringConstraints, ConfigDict
-from typing import  Annotated
+from typing import  Annotated, Any
+from datetime import date, datetime
 
 from typing import List, Optional
 
@@ -34,6 +35,126 @@ class ProductSchema(BaseModel):
 
     model_config = ConfigDict(from_attributes=True)
 
+# response schemas for the REST endpoints, each one limited to the columns its query loads
+class ProductCardVariantSchema(BaseModel):
+    id: int
+    product_id: int
+    image_url: Optional[str] = None
+    availability: str
+    latest_lowest_price_record: Optional[PriceHistorySchema] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class ProductCardSchema(BaseModel):
+    id: int
+    name: str
+    slug: str
+    category: Optional[str] = None
+    variants: List[ProductCardVariantSchema] = []
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class ProductListingVariantSchema(ProductCardVariantSchema):
+    variant_specs: dict[str, Any] = {}
+
+
+class ProductListingSchema(ProductCardSchema):
+    common_specs: dict[str, Any] = {}
+    variants: List[ProductListingVariantSchema] = []
+
+
+class ProductListingPageSchema(BaseModel):
+    data: List[ProductListingSchema]
+    # None on the keyset pages after the first one, which skip the count query
+    total: Optional[int]
+    # true when total is the planner's estimate, see SEARCH_COUNT_STRATEGY
+    total_is_estimate: bool = False
+    next_cursor: Optional[str] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class FacetValueSchema(BaseModel):
+    value: str
+    count: int
+
+
+class PriceHistoryRecordSchema(PriceHistorySchema):
+    id: int
+    variant_id: int
+    recorded_at: datetime
+
+
+class ProductDetailVariantSchema(BaseModel):
+    id: int
+    product_id: int
+    source_url: str
+    slug: str
+    availability: str
+    image_url: Optional[str] = None
+    variant_specs: dict[str, Any] = {}
+    created_at: Optional[datetime] = None
+    last_scraped_at: Optional[datetime] = None
+    # the full history is served in bounded buckets by /api/product/{slug}/price-history
+    latest_lowest_price_record: Optional[PriceHistoryRecordSchema] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class ProductDetailSchema(BaseModel):
+    id: int
+    name: str
+    slug: str
+    brand: str
+    category: str
+    description: Optional[str] = None
+    common_specs: dict[str, Any] = {}
+    created_at: Optional[datetime] = None
+    variants: List[ProductDetailVariantSchema] = []
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class PriceHistoryPointSchema(BaseModel):
+    bucket_start: date
+    min_price: float
+    max_price: float
+    last_price: float
+    currency: str
+
+
+class VariantPriceHistorySchema(BaseModel):
+    variant_id: int
+    points: List[PriceHistoryPointSchema] = []
+
+
+class PriceHistorySeriesSchema(BaseModel):
+    resolution: str
+    variants: List[VariantPriceHistorySchema] = []
+
+
+class ComparisonParentProductSchema(BaseModel):
+    id: int
+    name: str
+    slug: str
+    common_specs: dict[str, Any] = {}
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class ComparisonVariantSchema(BaseModel):
+    id: int
+    slug: str
+    image_url: Optional[str] = None
+    availability: str
+    variant_specs: dict[str, Any] = {}
+    parent_product: ComparisonParentProductSchema
+    latest_lowest_price_record: Optional[PriceHistorySchema] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
 class Filter(BaseModel):
     name: Annotated[
                 str,
@@ -1,6 +1,7 @@
 from enum import Enum
 
 class TaskStatus(str, Enum):
+    QUEUED = "QUEUED"
     CRAWLING = "CRAWLING"
     SCRAPING = "SCRAPING"
     ANALYZING = "ANALYZING"
@@ -10,6 +11,9 @@ class TaskStatus(str, Enum):
 class SubStatus(str, Enum):
     INITIALIZING = "INITIALIZING"
     SUCCESS = "SUCCESS"
+
+    WAITING_IN_QUEUE = "WAITING_IN_QUEUE"
+    QUEUE_FULL = "QUEUE_FULL"
     
     STARTING_SITES = "STARTING_SITES"
     COLLECTING_URLS = "COLLECTING_URLS"
@@ -19,6 +23,7 @@ class SubStatus(str, Enum):
     EXTRACTING_DATA = "EXTRACTING_DATA"
     EXTRACTION_COMPLETE = "EXTRACTION_COMPLETE"
     SENDING_CACHED_RESULTS = "SENDING_CACHED_RESULTS"
+    REFRESHING_PRICES = "REFRESHING_PRICES"
 
     GROUPING_PRODUCTS = "GROUPING_PRODUCTS"
     GROUPING_COMPLETE = "GROUPING_COMPLETE"
@@ -26,12 +31,15 @@ class SubStatus(str, Enum):
 
 
 STATUS_MESSAGES = {
+    (TaskStatus.QUEUED, SubStatus.WAITING_IN_QUEUE): "Анализът чака в опашката. Позиция: {count}",
+
     (TaskStatus.CRAWLING, SubStatus.INITIALIZING): "Инициализиране на търсенето...",
     (TaskStatus.CRAWLING, SubStatus.STARTING_SITES): "Стартиране на сканиране на {count} магазина...",
     (TaskStatus.CRAWLING, SubStatus.COLLECTING_URLS): "Приключи събирането на продуктови връзки.",
     (TaskStatus.CRAWLING, SubStatus.FILTERING_URLS): "Открити {count} релевантни продукта за анализ.",
     
     (TaskStatus.SCRAPING, SubStatus.SENDING_CACHED_RESULTS): "Изпращане на намерени кеширани продукти...",
+    (TaskStatus.SCRAPING, SubStatus.REFRESHING_PRICES): "Обновяване на цените и наличността на {count} известни продукта...",
     (TaskStatus.SCRAPING, SubStatus.INITIALIZING): "Започва извличане на детайлна информация на продуктите...",
     (TaskStatus.SCRAPING, SubStatus.GENERATING_SCHEMA): "Няма съществуваща схема за извличане на данни за тази категория. Генериране на нова схема...",
     (TaskStatus.SCRAPING, SubStatus.EXTRACTING_DATA): "Извличане на данни от {count} продукта...",
@@ -43,4 +51,5 @@ STATUS_MESSAGES = {
 
     (TaskStatus.COMPLETE, SubStatus.SUCCESS): "Анализът приключи успешно!",
     (TaskStatus.ERROR, None): "Възникна грешка по време на анализа.",
+    (TaskStatus.ERROR, SubStatus.QUEUE_FULL): "Системата е натоварена в момента. Моля, опитайте отново след малко.",
 }
\ No newline at end of file
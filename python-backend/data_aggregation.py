@@ -5,7 +5,8 @@ from sqlalchemy.orm.attributes import flag_modified
 from db.crud import (
     get_parent_product_by_name, 
     create_parent_product, 
-    create_product_variant,
+    bulk_upsert_product_variants,
+    VariantIngestData,
 )
 import re
 
@@ -178,6 +179,8 @@ def analyze_and_store_group(session: Session, group_key: str, group_items: list[
 
     existing_variants_by_url = {variant.source_url: variant for variant in parent_product.variants}
 
+    # new variants are collected and written in one batch, together with the parent product changes above
+    new_variants_data: list[VariantIngestData] = []
     for item in group_items:
         source_url: str = item.get('source_url')
         item_specs: dict[str,str] = item.get('specs')
@@ -186,12 +189,15 @@ def analyze_and_store_group(session: Session, group_key: str, group_items: list[
         if not existing_variant:
             print(f"Creating new variant from URL: {source_url}")
             variant_specs_dict = {key: normalize_value(item_specs.get(key)) for key in new_variant_keys}
-            variant_data = {
+            new_variants_data.append({
+                "product_id": parent_product.id,
                 "source_url": source_url, 
                 "availability": item.get('availability'), 
                 "image_url": item.get('image_url'),
                 "price": item.get('price'), 
                 "currency": item.get('currency'), 
                 "variant_specs": variant_specs_dict,
-            }
-            create_product_variant(session, product_id=parent_product.id, data=variant_data)
\ No newline at end of file
+            })
+
+    if new_variants_data:
+        bulk_upsert_product_variants(session, new_variants_data)
\ No newline at end of file
@@ -0,0 +1,162 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import Product, ProductVariant
+from .instrumentation import track_queries
+from .crud import (
+    build_products_by_category_stmt,
+    build_newest_products_stmt,
+    build_product_by_slug_stmt,
+    build_product_variants_for_comparison_stmt,
+    build_price_history_series_stmt,
+    format_price_history_series,
+    VariantPriceHistory,
+    build_search_products_stmts,
+    build_search_page,
+    build_search_count_stmt,
+    build_search_estimate_stmt,
+    is_price_sort,
+    parse_estimated_row_count,
+    get_cached_search_count,
+    cache_search_count,
+    SEARCH_COUNT_STRATEGY,
+    SEARCH_COUNT_ESTIMATE_THRESHOLD,
+    build_all_categories_stmt,
+    format_categories,
+    build_schema_by_product_category_stmt,
+    build_product_fingerprint_stmt,
+    build_variants_fingerprint_stmt,
+    build_catalog_fingerprint_stmt,
+    build_category_facets_stmt,
+    format_facets,
+)
+
+# Async counterparts of the read functions in crud.py. They run the same statements,
+# so every relationship a response needs is eager-loaded and nothing lazy-loads outside the session.
+
+@track_queries
+async def get_products_by_category(session: AsyncSession, category: str) -> list[Product]:
+    """
+    Returns a list of Product objects filtered by category,
+    loading only the fields needed to display them as preview cards.
+    """
+    result = await session.execute(build_products_by_category_stmt(category))
+    return result.scalars().all()
+
+@track_queries
+async def get_newest_products(session: AsyncSession, limit: int = 20) -> list[Product]:
+    """
+    Reads the newest parent products, loading only the essential fields
+    required to display them as product cards on the home page.
+    """
+    result = await session.execute(build_newest_products_stmt(limit))
+    return result.scalars().all()
+
+@track_queries
+async def get_product_by_slug(session: AsyncSession, slug: str) -> Product:
+    """Fetches a single product by its slug, with its variants and their current price records."""
+    result = await session.execute(build_product_by_slug_stmt(slug))
+    return result.scalars().first()
+
+@track_queries
+async def get_price_history_series(session: AsyncSession, slug: str, resolution: str) -> list[VariantPriceHistory]:
+    """Reads a bounded price history series per variant of a product from the rollups."""
+    rows = (await session.execute(build_price_history_series_stmt(slug, resolution))).all()
+    return format_price_history_series(rows)
+
+@track_queries
+async def get_product_variants_for_comparison(session: AsyncSession, variant_ids: list[int]) -> list[ProductVariant]:
+    """
+    Fetches variants by their IDs, loading only specific columns for the variant,
+    its latest price, and its parent product in the most efficient way.
+    """
+    result = await session.execute(build_product_variants_for_comparison_stmt(variant_ids))
+    return result.scalars().unique().all()
+
+@track_queries
+async def count_search_results(
+    session: AsyncSession,
+    query: str | None = None,
+    category: str | None = None,
+    spec_filters: dict[str, list[str]] | None = None,
+    count_strategy: str = SEARCH_COUNT_STRATEGY,
+    priced_only: bool = False,
+) -> tuple[int, bool]:
+    """Counts the products matching a search with the given strategy, returning (count, is_estimate)."""
+    if count_strategy == "cached":
+        cached_count = get_cached_search_count(query, category, spec_filters, priced_only)
+        if cached_count is not None:
+            return cached_count, False
+    elif count_strategy == "estimated":
+        estimate_stmt = build_search_estimate_stmt(query, category, spec_filters, priced_only)
+        estimated_count = parse_estimated_row_count((await session.execute(estimate_stmt)).scalar_one())
+        if estimated_count >= SEARCH_COUNT_ESTIMATE_THRESHOLD:
+            return estimated_count, True
+
+    total_count = (await session.execute(build_search_count_stmt(query, category, spec_filters, priced_only))).scalar_one()
+    if count_strategy == "cached":
+        cache_search_count(query, category, total_count, spec_filters, priced_only)
+    return total_count, False
+
+@track_queries
+async def search_products(
+    session: AsyncSession,
+    query: str | None = None,
+    category: str | None = None,
+    offset: int = 0,
+    limit: int = 12,
+    sort: str = "name-asc",
+    cursor: str | None = None,
+    spec_filters: dict[str, list[str]] | None = None,
+    count_strategy: str = SEARCH_COUNT_STRATEGY,
+):
+    """
+    Returns paginated and sorted products, along with the total count.
+    Pass a cursor ("" for the first page, then the returned next_cursor) to paginate by keyset instead of offset.
+    spec_filters maps a spec name to its accepted values, e.g. {"ram": ["8GB", "16GB"]}.
+    """
+    count_stmt, final_stmt = build_search_products_stmts(query, category, offset, limit, sort, cursor, spec_filters)
+    total_count, total_is_estimate = None, False
+    if count_stmt is not None:
+        total_count, total_is_estimate = await count_search_results(
+            session, query, category, spec_filters, count_strategy, is_price_sort(sort)
+        )
+    rows = (await session.execute(final_stmt)).all()
+
+    return build_search_page(rows, total_count, limit, sort, cursor, total_is_estimate)
+
+@track_queries
+async def get_all_categories(session: AsyncSession) -> list[dict[str, str]]:
+    """Return distinct product categories with URL slugs."""
+    categories: list[str] = (await session.execute(build_all_categories_stmt())).scalars().all()
+    return format_categories(categories)
+
+@track_queries
+async def get_schema_by_product_category(session: AsyncSession, category: str) -> dict[str, any]:
+    """Retrieves the current schema for a given product category."""
+    return (await session.execute(build_schema_by_product_category_stmt(category))).scalars().first()
+
+@track_queries
+async def get_product_fingerprint(session: AsyncSession, slug: str) -> tuple | None:
+    """Returns the ETag inputs of a product page, or None if the product does not exist."""
+    return (await session.execute(build_product_fingerprint_stmt(slug))).first()
+
+@track_queries
+async def get_variants_fingerprint(session: AsyncSession, variant_ids: list[int]) -> tuple:
+    """Returns the ETag inputs of a comparison between the given variants."""
+    return (await session.execute(build_variants_fingerprint_stmt(variant_ids))).one()
+
+@track_queries
+async def get_catalog_fingerprint(session: AsyncSession) -> tuple:
+    """Returns the catalog version that the search, category and facet ETags are computed from."""
+    return (await session.execute(build_catalog_fingerprint_stmt())).one()
+
+@track_queries
+async def get_category_facets(
+    session: AsyncSession,
+    category: str,
+    query: str | None = None,
+    spec_filters: dict[str, list[str]] | None = None,
+) -> dict[str, list[dict[str, any]]]:
+    """Returns the spec values of a category's products with their product counts, for filtered browsing."""
+    rows = (await session.execute(build_category_facets_stmt(category, query, spec_filters))).all()
+    return format_facets(rows)
@@ -1,31 +1,121 @@
+import os
+import json
+import base64
 from decimal import Decimal
-from sqlalchemy import or_, asc, desc
-from sqlalchemy.orm import Session, selectinload, load_only, joinedload
-from sqlalchemy.sql import func, select
+from dotenv import load_dotenv
+load_dotenv()
+
+from sqlalchemy import String, asc, cast, desc, literal, or_, tuple_, text, true, union_all, literal_column
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Session, aliased, selectinload, load_only, joinedload
+from sqlalchemy.sql import func, select, update, Select
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
 from slugify import slugify
 
-from typing import Literal
-from datetime import datetime, timedelta, timezone
+from typing import Literal, TypedDict
+from datetime import date, timedelta
+
+from .models import Product, ProductVariant, PriceHistory, PriceHistoryRollup, ProductCategorySchema
+from .helpers import allocate_unique_slugs, insert_with_unique_slug, is_slug_conflict, SLUG_ALLOCATION_MAX_ATTEMPTS, SessionLocal
+from .search import build_product_search_text, build_search_clauses
+from .instrumentation import track_queries
+from .rollups import rollup_price_records, PRICE_HISTORY_SERIES_POINTS
+from helpers.utils import get_spec_filters_key
+from helpers.response_cache import response_cache, product_cache_key, LATEST_PRODUCTS_KEY, CATEGORIES_KEY
+
+# how search_products counts the matching products: "exact", "cached" or "estimated", see count_search_results
+SEARCH_COUNT_STRATEGY = os.getenv("SEARCH_COUNT_STRATEGY", "exact")
+SEARCH_COUNT_CACHE_TTL_SECONDS = int(os.getenv("SEARCH_COUNT_CACHE_TTL_SECONDS", "60"))
+SEARCH_COUNT_ESTIMATE_THRESHOLD = int(os.getenv("SEARCH_COUNT_ESTIMATE_THRESHOLD", "10000"))
+
+def invalidate_product_responses(session: Session, product_id: int, include_categories: bool = False) -> None:
+    """Drops the cached catalog responses that show the given product."""
+    product_slug = session.execute(select(Product.slug).where(Product.id == product_id)).scalar_one_or_none()
+    keys = [LATEST_PRODUCTS_KEY]
+    if product_slug:
+        keys.append(product_cache_key(product_slug))
+    if include_categories:
+        keys.append(CATEGORIES_KEY)
+    response_cache.invalidate(*keys)
 
-from .models import Product, ProductVariant, PriceHistory, ProductCategorySchema
-from .helpers import generate_unique_slug, SessionLocal
+def refresh_product_min_current_price(session: Session, product_id: int) -> None:
+    """
+    Recomputes a product's lowest current price from its variants, inside the caller's transaction.
+    Called whenever a variant's current price changes, so price sorting never aggregates price history.
+    """
+    session.flush()
+    lowest_current_price = (
+        select(func.min(ProductVariant.current_price))
+        .where(ProductVariant.product_id == product_id)
+        .scalar_subquery()
+    )
+    session.execute(
+        update(Product)
+        .where(Product.id == product_id)
+        .values(min_current_price=lowest_current_price)
+        .execution_options(synchronize_session=False)
+    )
+
+def set_current_price_record(session: Session, variant: ProductVariant, price_record: PriceHistory) -> None:
+    """
+    Points a variant at its newest price record and refreshes the denormalized current prices
+    and the price rollups, inside the caller's transaction.
+    """
+    session.flush()
+    variant.current_price = price_record.price
+    variant.current_price_record_id = price_record.id
+    variant.current_price_recorded_at = price_record.recorded_at
+    refresh_product_min_current_price(session, variant.product_id)
+    rollup_price_records(session, [price_record.id], price_record.recorded_at)
+
+def insert_current_price_records(session: Session, price_rows: list[dict[str, any]]) -> None:
+    """
+    Inserts a batch of price records (variant_id, price, currency) in one statement and makes each
+    its variant's current price, then refreshes the product-level minimums and the price rollups,
+    inside the caller's transaction.
+    """
+    if not price_rows:
+        return
+    price_records = session.execute(
+        postgresql.insert(PriceHistory).values(price_rows).returning(PriceHistory.id, PriceHistory.recorded_at)
+    ).all()
+    price_record_ids = [record_id for record_id, _ in price_records]
+    # the new records are all in the newest partitions, so the lookups below skip the older ones
+    recorded_since = min(recorded_at for _, recorded_at in price_records)
+    # point every repriced variant at its new record, then refresh the product-level minimum
+    repriced_product_ids = session.execute(text("""
+        UPDATE product_variants AS pv
+        SET current_price = ph.price, current_price_record_id = ph.id, current_price_recorded_at = ph.recorded_at
+        FROM price_history AS ph
+        WHERE ph.id = ANY(:price_record_ids) AND ph.recorded_at >= :recorded_since AND pv.id = ph.variant_id
+        RETURNING pv.product_id
+    """), {"price_record_ids": price_record_ids, "recorded_since": recorded_since}).scalars().all()
+    session.execute(text("""
+        UPDATE products AS p
+        SET min_current_price = (
+            SELECT min(pv.current_price) FROM product_variants AS pv WHERE pv.product_id = p.id
+        )
+        WHERE p.id = ANY(:product_ids)
+    """), {"product_ids": list(set(repriced_product_ids))})
+    rollup_price_records(session, price_record_ids, recorded_since)
 
+@track_queries
 def create_parent_product(session: Session, data: dict[str, any]) -> Product:
     """Creates a new parent product in the database."""
-    parent_slug = generate_unique_slug(session, Product, data['name'])
-    
     new_product = Product(
         name=data['name'],
-        slug=parent_slug,
         brand=data.get('brand'),
         category=data.get('category'),
         description=data.get('description'),
-        common_specs=data.get('common_specs')
+        common_specs=data.get('common_specs'),
+        search_text=build_product_search_text(data['name'], data.get('brand') or ''),
     )
     
-    session.add(new_product)
     try:
+        insert_with_unique_slug(session, new_product, data['name'])
         session.commit()
     except IntegrityError:
         print(f"  [DB] Integrity error (likely a race condition). Rolling back.")
@@ -36,23 +126,22 @@ def create_parent_product(session: Session, data: dict[str, any]) -> Product:
         raise
 
     session.refresh(new_product)
+    # a new product can also introduce a new category
+    response_cache.invalidate(LATEST_PRODUCTS_KEY, CATEGORIES_KEY, product_cache_key(new_product.slug))
     print(f"  [DB CRUD] Created Parent Product: '{new_product.name}' (ID: {new_product.id})")
     return new_product
 
+@track_queries
 def create_product_variant(session: Session, product_id: int, data: dict[str, any]) -> ProductVariant:
     """Creates a new product variant, associated with a parent product."""
     variant_slug_source = data.get('variant_specs') or data.get('source_url')
-    variant_slug = generate_unique_slug(
-        session, ProductVariant, variant_slug_source, product_id=product_id
-    )
     
     new_variant = ProductVariant(
         product_id=product_id,
         source_url=data['source_url'],
-        slug=variant_slug,
         availability=data['availability'],
         image_url=data['image_url'],
-        variant_specs=data.get('variant_specs', {})
+        variant_specs=data.get('variant_specs', {}),
     )
     
     # create the first price history entry for the new variant
@@ -61,8 +150,9 @@ def create_product_variant(session: Session, product_id: int, data: dict[str, an
     price_entry = PriceHistory(price=price, currency=currency)
     new_variant.price_history.append(price_entry)
     
-    session.add(new_variant)
     try:
+        insert_with_unique_slug(session, new_variant, variant_slug_source)
+        set_current_price_record(session, new_variant, price_entry)
         session.commit()
     except IntegrityError:
         print(f"  [DB] Integrity error (likely a race condition). Rolling back.")
@@ -72,8 +162,193 @@ def create_product_variant(session: Session, product_id: int, data: dict[str, an
         session.rollback()
         raise
 
+    invalidate_product_responses(session, product_id)
     print(f"  [DB CRUD] Created Variant for Product ID {product_id} from URL: {data['source_url']}")
 
+class VariantIngestData(TypedDict):
+    product_id: int
+    source_url: str
+    availability: str
+    image_url: str | None
+    variant_specs: dict[str, any]
+    price: float | None
+    currency: str | None
+
+class BulkUpsertResult(TypedDict):
+    inserted_variants: int
+    updated_variants: int
+    price_records: int
+
+@track_queries
+def bulk_upsert_product_variants(session: Session, variants_data: list[VariantIngestData]) -> BulkUpsertResult:
+    """
+    Ingests a batch of scraped variants in one transaction and a fixed number of statements:
+    new variants are inserted and known ones (by source_url) get their availability, image and
+    scrape time refreshed, with a single INSERT ... ON CONFLICT. A price record is added in one
+    multi-row INSERT for every new variant and every variant whose price changed.
+    """
+    # the last entry wins if a URL appears twice, as ON CONFLICT cannot touch the same row twice in one statement
+    variants_by_url = {data['source_url']: data for data in variants_data}
+    if not variants_by_url:
+        return {"inserted_variants": 0, "updated_variants": 0, "price_records": 0}
+
+    known_slugs_by_url = dict(session.execute(
+        select(ProductVariant.source_url, ProductVariant.slug).where(ProductVariant.source_url.in_(variants_by_url))
+    ).all())
+    new_variants_data = [data for url, data in variants_by_url.items() if url not in known_slugs_by_url]
+    new_slug_sources = [data.get('variant_specs') or data['source_url'] for data in new_variants_data]
+
+    def build_upsert_stmt(new_slugs: list[str]):
+        slugs_by_url = {**known_slugs_by_url, **{data['source_url']: slug for data, slug in zip(new_variants_data, new_slugs)}}
+        variant_rows = [
+            {
+                "product_id": data['product_id'],
+                "source_url": url,
+                "slug": slugs_by_url[url],
+                "availability": data['availability'],
+                "image_url": data.get('image_url'),
+                "variant_specs": data.get('variant_specs') or {},
+            }
+            for url, data in variants_by_url.items()
+        ]
+        insert_stmt = postgresql.insert(ProductVariant).values(variant_rows)
+        return insert_stmt.on_conflict_do_update(
+            index_elements=[ProductVariant.source_url],
+            set_={
+                "availability": insert_stmt.excluded.availability,
+                "image_url": func.coalesce(insert_stmt.excluded.image_url, ProductVariant.image_url),
+                "last_scraped_at": func.now(),
+            },
+        ).returning(ProductVariant.id, ProductVariant.product_id, ProductVariant.source_url, ProductVariant.current_price)
+
+    try:
+        # slugs are allocated optimistically; if a concurrent writer takes one, only the savepoint is retried
+        for attempt in range(1, SLUG_ALLOCATION_MAX_ATTEMPTS + 1):
+            new_slugs = allocate_unique_slugs(session, ProductVariant, new_slug_sources)
+            try:
+                with session.begin_nested():
+                    upserted_variants = session.execute(build_upsert_stmt(new_slugs)).all()
+                break
+            except IntegrityError as e:
+                if not is_slug_conflict(e) or attempt == SLUG_ALLOCATION_MAX_ATTEMPTS:
+                    raise
+                print("  [DB] A variant slug was taken by a concurrent insert. Allocating the batch's slugs again.")
+
+        price_rows = []
+        for variant_id, _, source_url, current_price in upserted_variants:
+            data = variants_by_url[source_url]
+            if data.get('price') is None:
+                continue
+            if current_price is None or current_price != Decimal(str(data['price'])):
+                price_rows.append({"variant_id": variant_id, "price": data['price'], "currency": data.get('currency') or 'BGN'})
+
+        insert_current_price_records(session, price_rows)
+        session.commit()
+    except IntegrityError as e:
+        print(f"  [DB] Integrity error during bulk ingestion: {e}. Rolling back.")
+        session.rollback()
+        return {"inserted_variants": 0, "updated_variants": 0, "price_records": 0}
+    except Exception as e:
+        print(f"  [DB] An unexpected error occurred: {e}. Rolling back.")
+        session.rollback()
+        raise
+
+    affected_product_ids = {product_id for _, product_id, _, _ in upserted_variants}
+    product_slugs = session.execute(select(Product.slug).where(Product.id.in_(affected_product_ids))).scalars().all()
+    response_cache.invalidate(LATEST_PRODUCTS_KEY, *(product_cache_key(slug) for slug in product_slugs))
+
+    result: BulkUpsertResult = {
+        "inserted_variants": len(new_variants_data),
+        "updated_variants": len(variants_by_url) - len(new_variants_data),
+        "price_records": len(price_rows),
+    }
+    print(
+        f"  [DB CRUD] Bulk ingested {len(variants_by_url)} variants: {result['inserted_variants']} new, "
+        f"{result['updated_variants']} refreshed, {result['price_records']} price records."
+    )
+    return result
+
+class VariantRefreshData(TypedDict):
+    source_url: str
+    content_hash: str
+    # both None when the page is unchanged since the last scrape, which only bumps last_scraped_at
+    availability: str | None
+    price: float | None
+
+class BulkRefreshResult(TypedDict):
+    refreshed_variants: int
+    unchanged_variants: int
+    price_records: int
+
+@track_queries
+def bulk_refresh_product_variants(session: Session, refresh_data: list[VariantRefreshData]) -> BulkRefreshResult:
+    """
+    Writes the prices and availabilities re-scraped from known variants in one transaction and a fixed
+    number of statements: a single UPDATE refreshes availability, content hash and scrape time, and a
+    price record is added in one multi-row INSERT for every variant whose price changed.
+    Unknown URLs are ignored.
+    """
+    refresh_by_url = {data['source_url']: data for data in refresh_data}
+    if not refresh_by_url:
+        return {"refreshed_variants": 0, "unchanged_variants": 0, "price_records": 0}
+
+    try:
+        refreshed_variants = session.execute(text("""
+            UPDATE product_variants AS pv
+            SET availability = coalesce(scraped.availability, pv.availability),
+                content_hash = scraped.content_hash,
+                last_scraped_at = now()
+            FROM unnest(
+                CAST(:source_urls AS varchar[]), CAST(:availabilities AS varchar[]), CAST(:content_hashes AS varchar[])
+            ) AS scraped (source_url, availability, content_hash)
+            WHERE pv.source_url = scraped.source_url
+            RETURNING pv.id, pv.product_id, pv.source_url, pv.current_price, (
+                SELECT ph.currency FROM price_history AS ph
+                WHERE ph.id = pv.current_price_record_id AND ph.recorded_at = pv.current_price_recorded_at
+            )
+        """), {
+            "source_urls": list(refresh_by_url),
+            "availabilities": [data.get('availability') for data in refresh_by_url.values()],
+            "content_hashes": [data['content_hash'] for data in refresh_by_url.values()],
+        }).all()
+
+        price_rows = []
+        for variant_id, _, source_url, current_price, currency in refreshed_variants:
+            new_price = refresh_by_url[source_url].get('price')
+            if new_price is None:
+                continue
+            if current_price is None or current_price != Decimal(str(new_price)):
+                # the markdown only gives the amount, so the variant keeps its current currency
+                price_rows.append({"variant_id": variant_id, "price": new_price, "currency": currency or 'BGN'})
+
+        insert_current_price_records(session, price_rows)
+        session.commit()
+    except IntegrityError as e:
+        print(f"  [DB] Integrity error during bulk refresh: {e}. Rolling back.")
+        session.rollback()
+        return {"refreshed_variants": 0, "unchanged_variants": 0, "price_records": 0}
+    except Exception as e:
+        print(f"  [DB] An unexpected error occurred: {e}. Rolling back.")
+        session.rollback()
+        raise
+
+    affected_product_ids = {product_id for _, product_id, _, _, _ in refreshed_variants}
+    product_slugs = session.execute(select(Product.slug).where(Product.id.in_(affected_product_ids))).scalars().all()
+    response_cache.invalidate(LATEST_PRODUCTS_KEY, *(product_cache_key(slug) for slug in product_slugs))
+
+    unchanged_urls = {url for url, data in refresh_by_url.items() if data.get('availability') is None}
+    result: BulkRefreshResult = {
+        "refreshed_variants": len(refreshed_variants),
+        "unchanged_variants": sum(1 for _, _, source_url, _, _ in refreshed_variants if source_url in unchanged_urls),
+        "price_records": len(price_rows),
+    }
+    print(
+        f"  [DB CRUD] Bulk refreshed {result['refreshed_variants']} variants: {result['unchanged_variants']} unchanged, "
+        f"{result['price_records']} price changes."
+    )
+    return result
+
+@track_queries
 def create_product_category_schema(session: Session, category: str, schema_def: dict[str, any]) -> ProductCategorySchema:
     """
     Creates product category schema in the database.
@@ -97,13 +372,9 @@ def create_product_category_schema(session: Session, category: str, schema_def:
 
     return db_schema
 
-def get_products_by_category(session: Session, category: str):
-    """
-    Returns a list of Product objects filtered by category,
-    loading only the fields needed to display them as preview cards.
-    """
-
-    stmt = (
+def build_products_by_category_stmt(category: str) -> Select:
+    """Builds the query behind get_products_by_category, shared with its async version."""
+    return (
         select(Product)
         .where(Product.category == category)
         .options(
@@ -117,7 +388,10 @@ def get_products_by_category(session: Session, category: str):
                 ProductVariant.id,        
                 ProductVariant.product_id,
                 ProductVariant.image_url,
-                ProductVariant.availability  
+                ProductVariant.availability,
+                # the pointer columns let latest_lowest_price_record load by primary key
+                ProductVariant.current_price_record_id,
+                ProductVariant.current_price_recorded_at,
             ),
             selectinload(Product.variants).selectinload(ProductVariant.latest_lowest_price_record).load_only( 
                 PriceHistory.price, 
@@ -127,15 +401,18 @@ def get_products_by_category(session: Session, category: str):
         .order_by(Product.created_at.desc())
     )
 
-    result = session.execute(stmt)
-    return result.scalars().all()
-
-def get_newest_products(session: Session, limit: int = 20) -> list[Product]:
+@track_queries
+def get_products_by_category(session: Session, category: str):
     """
-    Reads the newest parent products, loading only the essential fields 
-    required to display them as product cards on the home page.
+    Returns a list of Product objects filtered by category,
+    loading only the fields needed to display them as preview cards.
     """
-    stmt = (
+    result = session.execute(build_products_by_category_stmt(category))
+    return result.scalars().all()
+
+def build_newest_products_stmt(limit: int = 20) -> Select:
+    """Builds the query behind get_newest_products, shared with its async version."""
+    return (
         select(Product)
         .options(
             load_only(
@@ -148,7 +425,10 @@ def get_newest_products(session: Session, limit: int = 20) -> list[Product]:
                 ProductVariant.id,        
                 ProductVariant.product_id,
                 ProductVariant.image_url,
-                ProductVariant.availability  
+                ProductVariant.availability,
+                # the pointer columns let latest_lowest_price_record load by primary key
+                ProductVariant.current_price_record_id,
+                ProductVariant.current_price_recorded_at,
             ),
             selectinload(Product.variants).selectinload(ProductVariant.latest_lowest_price_record).load_only( 
                 PriceHistory.price, 
@@ -158,34 +438,112 @@ def get_newest_products(session: Session, limit: int = 20) -> list[Product]:
         .order_by(Product.created_at.desc())
         .limit(limit)
     )
-    result = session.execute(stmt)
+
+@track_queries
+def get_newest_products(session: Session, limit: int = 20) -> list[Product]:
+    """
+    Reads the newest parent products, loading only the essential fields 
+    required to display them as product cards on the home page.
+    """
+    result = session.execute(build_newest_products_stmt(limit))
     return result.scalars().all()
 
-def get_product_by_slug(session: Session, slug: str) -> Product:
-    """Fetches a single product and its variants and their price history by its slug."""
-    stmt = (
+def build_product_by_slug_stmt(slug: str) -> Select:
+    """Builds the query behind get_product_by_slug, shared with its async version."""
+    return (
         select(Product)
         .options(
-            selectinload(Product.variants).selectinload(ProductVariant.price_history)
+            # the price chart reads its bounded series from get_price_history_series instead of the full history
+            selectinload(Product.variants).selectinload(ProductVariant.latest_lowest_price_record)
         )
         .where(Product.slug == slug)
     )
-    result = session.execute(stmt).scalars().first()
+
+@track_queries
+def get_product_by_slug(session: Session, slug: str) -> Product:
+    """Fetches a single product by its slug, with its variants and their current price records."""
+    result = session.execute(build_product_by_slug_stmt(slug)).scalars().first()
     return result
 
-def get_product_variants_for_comparison(session: Session, variant_ids: list[int]) -> list[ProductVariant]:
+class PriceHistoryPoint(TypedDict):
+    bucket_start: date
+    min_price: Decimal
+    max_price: Decimal
+    last_price: Decimal
+    currency: str
+
+class VariantPriceHistory(TypedDict):
+    variant_id: int
+    points: list[PriceHistoryPoint]
+
+def build_price_history_series_stmt(slug: str, resolution: str) -> Select:
     """
-    Fetches variants by their IDs, loading only specific columns for the variant,
-    its latest price, and its parent product in the most efficient way.
+    Builds the query behind get_price_history_series: the most recent buckets of each variant
+    of a product at the given resolution, oldest first. Shared with its async version.
     """
-    stmt = (
+    bucket_rank = func.row_number().over(
+        partition_by=PriceHistoryRollup.variant_id, order_by=PriceHistoryRollup.bucket_start.desc()
+    ).label("bucket_rank")
+    ranked_buckets = (
+        select(
+            PriceHistoryRollup.variant_id,
+            PriceHistoryRollup.bucket_start,
+            PriceHistoryRollup.min_price,
+            PriceHistoryRollup.max_price,
+            PriceHistoryRollup.last_price,
+            PriceHistoryRollup.currency,
+            bucket_rank,
+        )
+        .join(ProductVariant, ProductVariant.id == PriceHistoryRollup.variant_id)
+        .join(Product, Product.id == ProductVariant.product_id)
+        .where(Product.slug == slug, PriceHistoryRollup.resolution == resolution)
+        .subquery()
+    )
+    return (
+        select(
+            ranked_buckets.c.variant_id,
+            ranked_buckets.c.bucket_start,
+            ranked_buckets.c.min_price,
+            ranked_buckets.c.max_price,
+            ranked_buckets.c.last_price,
+            ranked_buckets.c.currency,
+        )
+        .where(ranked_buckets.c.bucket_rank <= PRICE_HISTORY_SERIES_POINTS[resolution])
+        .order_by(ranked_buckets.c.variant_id, ranked_buckets.c.bucket_start)
+    )
+
+def format_price_history_series(rows: list) -> list[VariantPriceHistory]:
+    """Groups the rows of build_price_history_series_stmt by variant."""
+    series: dict[int, VariantPriceHistory] = {}
+    for variant_id, bucket_start, min_price, max_price, last_price, currency in rows:
+        variant_series = series.setdefault(variant_id, {"variant_id": variant_id, "points": []})
+        variant_series["points"].append({
+            "bucket_start": bucket_start,
+            "min_price": min_price,
+            "max_price": max_price,
+            "last_price": last_price,
+            "currency": currency,
+        })
+    return list(series.values())
+
+@track_queries
+def get_price_history_series(session: Session, slug: str, resolution: str) -> list[VariantPriceHistory]:
+    """Reads a bounded price history series per variant of a product from the rollups."""
+    rows = session.execute(build_price_history_series_stmt(slug, resolution)).all()
+    return format_price_history_series(rows)
+
+def build_product_variants_for_comparison_stmt(variant_ids: list[int]) -> Select:
+    """Builds the query behind get_product_variants_for_comparison, shared with its async version."""
+    return (
         select(ProductVariant)
         .options(
             load_only(
                 ProductVariant.slug,
                 ProductVariant.image_url,
                 ProductVariant.availability,
-                ProductVariant.variant_specs
+                ProductVariant.variant_specs,
+                ProductVariant.current_price_record_id,
+                ProductVariant.current_price_recorded_at,
             ),
             selectinload(ProductVariant.latest_lowest_price_record).load_only(
                 PriceHistory.price,
@@ -200,9 +558,282 @@ def get_product_variants_for_comparison(session: Session, variant_ids: list[int]
         )
         .where(ProductVariant.id.in_(variant_ids))
     )
-    
-    return session.execute(stmt).scalars().unique().all()
 
+@track_queries
+def get_product_variants_for_comparison(session: Session, variant_ids: list[int]) -> list[ProductVariant]:
+    """
+    Fetches variants by their IDs, loading only specific columns for the variant,
+    its latest price, and its parent product in the most efficient way.
+    """
+    return session.execute(build_product_variants_for_comparison_stmt(variant_ids)).scalars().unique().all()
+
+def build_spec_value_candidates(value: str) -> list[any]:
+    """Returns the JSON values a spec filter value can be stored as, since the LLM extraction may emit numbers as strings or not."""
+    candidates: list[any] = [value]
+    try:
+        number = float(value)
+    except ValueError:
+        return candidates
+    candidates.append(int(number) if number.is_integer() else number)
+    return candidates
+
+def build_spec_filter_clauses(spec_filters: dict[str, list[str]]) -> list:
+    """
+    Builds one condition per filtered spec: the product's common specs or any of its variant's specs
+    hold one of the selected values. Every condition is a JSONB containment (@>), which is served
+    by the jsonb_path_ops GIN indexes on common_specs and variant_specs.
+    """
+    # an alias keeps the EXISTS correlated to Product, also in queries that already join ProductVariant
+    filtered_variant = aliased(ProductVariant)
+    clauses = []
+    for spec_name, selected_values in spec_filters.items():
+        if not selected_values:
+            continue
+        # built as casted strings rather than JSONB parameters, so the filter also renders as literal SQL
+        containments = [
+            cast(literal(json.dumps({spec_name: candidate}, ensure_ascii=False), String), JSONB)
+            for value in selected_values
+            for candidate in build_spec_value_candidates(value)
+        ]
+        variant_matches = (
+            select(filtered_variant.id)
+            .where(filtered_variant.product_id == Product.id)
+            .where(or_(*(filtered_variant.variant_specs.contains(containment) for containment in containments)))
+            .exists()
+        )
+        clauses.append(or_(
+            *(Product.common_specs.contains(containment) for containment in containments),
+            variant_matches,
+        ))
+    return clauses
+
+def apply_search_filters(
+    stmt: Select,
+    query: str | None = None,
+    category: str | None = None,
+    spec_filters: dict[str, list[str]] | None = None,
+    priced_only: bool = False,
+) -> Select:
+    """
+    Adds the text query, category and spec filters used by product search to a statement on Product.
+    priced_only leaves out the products without a current price, as the price sorts do.
+    """
+    if priced_only:
+        stmt = stmt.where(Product.min_current_price.is_not(None))
+    if query:
+        search_condition, _ = build_search_clauses(query)
+        stmt = stmt.where(search_condition)
+    if category:
+        stmt = stmt.where(Product.category == category)
+    if spec_filters:
+        stmt = stmt.where(*build_spec_filter_clauses(spec_filters))
+    return stmt
+
+def encode_search_cursor(sort: str, sort_value: any, product_id: int) -> str:
+    """Encodes the position after the last product of a page as an opaque, URL-safe cursor."""
+    if isinstance(sort_value, Decimal):
+        sort_value = str(sort_value)
+    raw_cursor = json.dumps([sort, sort_value, product_id], ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw_cursor.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_search_cursor(cursor: str, sort: str) -> tuple[any, int]:
+    """
+    Decodes a cursor produced by encode_search_cursor into (sort value, product id).
+    Raises ValueError if the cursor is malformed or was issued for a different sort mode.
+    """
+    try:
+        padded_cursor = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, sort_value, product_id = json.loads(base64.urlsafe_b64decode(padded_cursor))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid pagination cursor.") from e
+    if cursor_sort != sort or not isinstance(product_id, int):
+        raise ValueError("The pagination cursor does not match the requested sort order.")
+    if is_price_sort(sort):
+        sort_value = Decimal(sort_value)
+    return sort_value, product_id
+
+def is_price_sort(sort: str) -> bool:
+    """Whether a sort orders by price, which only the products with a current price can take part in."""
+    return sort in ("price-asc", "price-desc")
+
+def build_search_count_stmt(
+    query: str | None = None,
+    category: str | None = None,
+    spec_filters: dict[str, list[str]] | None = None,
+    priced_only: bool = False,
+) -> Select:
+    """Builds the exact count of the products matching a search."""
+    filtered_stmt = apply_search_filters(select(Product.id), query, category, spec_filters, priced_only)
+    return select(func.count()).select_from(filtered_stmt.subquery())
+
+class ExplainJson(Executable, ClauseElement):
+    """EXPLAIN (FORMAT JSON) of a statement, compiled by the executing dialect with bound parameters."""
+    inherit_cache = False
+
+    def __init__(self, statement: Select):
+        self.statement = statement
+
+@compiles(ExplainJson, "postgresql")
+def compile_explain_json(element: ExplainJson, compiler, **kw) -> str:
+    return f"EXPLAIN (FORMAT JSON) {compiler.process(element.statement, **kw)}"
+
+def build_search_estimate_stmt(
+    query: str | None = None,
+    category: str | None = None,
+    spec_filters: dict[str, list[str]] | None = None,
+    priced_only: bool = False,
+) -> ExplainJson:
+    """Builds an EXPLAIN of the search filter, whose top plan node carries the planner's row estimate."""
+    filtered_stmt = apply_search_filters(select(Product.id), query, category, spec_filters, priced_only)
+    return ExplainJson(filtered_stmt)
+
+def parse_estimated_row_count(explain_output: any) -> int:
+    """Reads the row estimate from the output of an EXPLAIN (FORMAT JSON) query."""
+    if isinstance(explain_output, str):
+        explain_output = json.loads(explain_output)
+    return int(explain_output[0]["Plan"]["Plan Rows"])
+
+def search_count_cache_key(
+    query: str | None, category: str | None, spec_filters: dict[str, list[str]] | None = None, priced_only: bool = False
+) -> str:
+    scope = "priced" if priced_only else "all"
+    return f"search-count:{scope}:{category or ''}:{(query or '').strip().lower()}:{get_spec_filters_key(spec_filters or {})}"
+
+def get_cached_search_count(
+    query: str | None, category: str | None, spec_filters: dict[str, list[str]] | None = None, priced_only: bool = False
+) -> int | None:
+    cached_count = response_cache.get(search_count_cache_key(query, category, spec_filters, priced_only))
+    return int(cached_count) if cached_count is not None else None
+
+def cache_search_count(
+    query: str | None,
+    category: str | None,
+    total_count: int,
+    spec_filters: dict[str, list[str]] | None = None,
+    priced_only: bool = False,
+) -> None:
+    response_cache.set(
+        search_count_cache_key(query, category, spec_filters, priced_only),
+        str(total_count).encode("ascii"),
+        ttl_seconds=SEARCH_COUNT_CACHE_TTL_SECONDS,
+    )
+
+@track_queries
+def count_search_results(
+    session: Session,
+    query: str | None = None,
+    category: str | None = None,
+    spec_filters: dict[str, list[str]] | None = None,
+    count_strategy: str = SEARCH_COUNT_STRATEGY,
+    priced_only: bool = False,
+) -> tuple[int, bool]:
+    """
+    Counts the products matching a search with the given strategy, returning (count, is_estimate):
+    - "exact" always runs count(*);
+    - "cached" reuses the exact count of the same query and category for SEARCH_COUNT_CACHE_TTL_SECONDS;
+    - "estimated" returns the planner's estimate when it is above SEARCH_COUNT_ESTIMATE_THRESHOLD,
+      where an exact count would dominate the page latency, and counts exactly below it.
+    """
+    if count_strategy == "cached":
+        cached_count = get_cached_search_count(query, category, spec_filters, priced_only)
+        if cached_count is not None:
+            return cached_count, False
+    elif count_strategy == "estimated":
+        estimate_stmt = build_search_estimate_stmt(query, category, spec_filters, priced_only)
+        estimated_count = parse_estimated_row_count(session.execute(estimate_stmt).scalar_one())
+        if estimated_count >= SEARCH_COUNT_ESTIMATE_THRESHOLD:
+            return estimated_count, True
+
+    total_count = session.execute(build_search_count_stmt(query, category, spec_filters, priced_only)).scalar_one()
+    if count_strategy == "cached":
+        cache_search_count(query, category, total_count, spec_filters, priced_only)
+    return total_count, False
+
+def build_search_products_stmts(
+    query: str | None = None,
+    category: str | None = None,
+    offset: int = 0,
+    limit: int = 12,
+    sort: str = "name-asc",
+    cursor: str | None = None,
+    spec_filters: dict[str, list[str]] | None = None,
+) -> tuple[Select | None, Select]:
+    """
+    Builds the count query and the page query behind search_products,
+    shared with its async version.
+    The page query selects each product with its sort value, so the next cursor can be built from the last row.
+    If a cursor is given, the page is fetched by keyset instead of OFFSET: it starts right after the cursor
+    and holds one extra row that tells whether there is a next page. The count query is then only built
+    for the first page (an empty cursor) and is None for the following ones.
+    """
+    # products without a recorded price have no position in a price ordering, so the price sorts
+    # leave them out of both the page and the count
+    priced_only = is_price_sort(sort)
+    stmt = apply_search_filters(select(Product), query, category, spec_filters, priced_only)
+        
+    count_stmt = None
+    if cursor is None or cursor == "":
+        count_stmt = build_search_count_stmt(query, category, spec_filters, priced_only)
+
+    if priced_only:
+        # min_current_price is maintained on writes, so this is an index scan on (min_current_price, id)
+        sort_column = Product.min_current_price
+    elif sort == "relevance" and query:
+        _, sort_column = build_search_clauses(query)
+    elif sort == "created-desc" or sort == "created-asc":
+        sort_column = Product.id
+    else: 
+        sort_column = Product.name
+
+    # the product id breaks ties, so products sharing a name or price keep a stable order across pages
+    is_descending = sort in ("price-desc", "created-desc", "name-desc") or (sort == "relevance" and query)
+    order_direction = desc if is_descending else asc
+    order_by_clauses = [order_direction(sort_column)]
+    if sort_column is not Product.id:
+        order_by_clauses.append(order_direction(Product.id))
+
+    stmt = stmt.add_columns(sort_column.label("sort_value")).order_by(*order_by_clauses)
+    if cursor is None:
+        stmt = stmt.offset(offset).limit(limit)
+    else:
+        if cursor:
+            after_value, after_id = decode_search_cursor(cursor, sort)
+            if sort_column is Product.id:
+                keyset_position = Product.id < after_id if is_descending else Product.id > after_id
+            else:
+                sort_key, after_key = tuple_(sort_column, Product.id), tuple_(after_value, after_id)
+                keyset_position = sort_key < after_key if is_descending else sort_key > after_key
+            stmt = stmt.where(keyset_position)
+        stmt = stmt.limit(limit + 1)
+
+    final_stmt = stmt.options(
+        selectinload(Product.variants)
+        .selectinload(ProductVariant.latest_lowest_price_record)
+    )
+    return count_stmt, final_stmt
+
+def build_search_page(
+    rows: list,
+    total_count: int | None,
+    limit: int,
+    sort: str,
+    cursor: str | None,
+    total_is_estimate: bool = False,
+) -> dict[str, any]:
+    """Turns the (product, sort value) rows of a page query into the search response, with the next cursor in keyset mode."""
+    next_cursor = None
+    if cursor is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last_product, last_sort_value = rows[-1]
+        next_cursor = encode_search_cursor(sort, last_sort_value, last_product.id)
+    return {
+        "data": [product for product, _ in rows],
+        "total": total_count,
+        "total_is_estimate": total_is_estimate,
+        "next_cursor": next_cursor,
+    }
+
+@track_queries
 def search_products(
     session: Session,
     query: str | None = None,
@@ -210,137 +841,206 @@ def search_products(
     offset: int = 0,
     limit: int = 12,
     sort: str = "name-asc",
+    cursor: str | None = None,
+    spec_filters: dict[str, list[str]] | None = None,
+    count_strategy: str = SEARCH_COUNT_STRATEGY,
 ):
     """
     Returns paginated and sorted products, along with the total count.
+    Pass a cursor ("" for the first page, then the returned next_cursor) to paginate by keyset instead of offset.
+    spec_filters maps a spec name to its accepted values, e.g. {"ram": ["8GB", "16GB"]}.
     """
-    stmt = select(Product)
-    if query:
-        q = f"%{query}%"
-        stmt = stmt.where(or_(Product.name.ilike(q), Product.brand.ilike(q)))
-    if category:
-        stmt = stmt.where(Product.category == category)
-        
-    count_stmt = select(func.count()).select_from(stmt.subquery())
-    total_count = session.execute(count_stmt).scalar_one()
+    count_stmt, final_stmt = build_search_products_stmts(query, category, offset, limit, sort, cursor, spec_filters)
+    total_count, total_is_estimate = None, False
+    if count_stmt is not None:
+        total_count, total_is_estimate = count_search_results(
+            session, query, category, spec_filters, count_strategy, is_price_sort(sort)
+        )
+    rows = session.execute(final_stmt).all()
+    
+    return build_search_page(rows, total_count, limit, sort, cursor, total_is_estimate)
 
-    if sort == "price-asc" or sort == "price-desc":
-        # use subquery to find the minimum price for each product
-        subq = (
-            select(
-                ProductVariant.product_id,
-                func.min(PriceHistory.price).label("min_price"),
-            )
-            .join(PriceHistory)
-            .group_by(ProductVariant.product_id)
-            .subquery()
+# spec values that hold lists or objects (e.g. "features") are left out of the facets
+FACET_VALUE_TYPES = ("string", "number", "boolean")
+
+def build_category_facets_stmt(
+    category: str,
+    query: str | None = None,
+    spec_filters: dict[str, list[str]] | None = None,
+) -> Select:
+    """
+    Builds the facet counts of a category: for every scalar spec value found in the common or
+    variant specs of the matching products, the number of distinct products that have it.
+    """
+    matching_products = apply_search_filters(select(Product.id), query, category, spec_filters).subquery()
+
+    common_spec = func.jsonb_each(Product.common_specs).table_valued("key", "value").lateral()
+    common_spec_values = (
+        select(Product.id.label("product_id"), common_spec.c.key, common_spec.c.value)
+        .join(common_spec, true())
+        .where(Product.id.in_(select(matching_products.c.id)))
+    )
+    variant_spec = func.jsonb_each(ProductVariant.variant_specs).table_valued("key", "value").lateral()
+    variant_spec_values = (
+        select(ProductVariant.product_id, variant_spec.c.key, variant_spec.c.value)
+        .join(variant_spec, true())
+        .where(ProductVariant.product_id.in_(select(matching_products.c.id)))
+    )
+    spec_values = union_all(common_spec_values, variant_spec_values).subquery()
+
+    facet_value = spec_values.c.value.op("#>>")(literal_column("'{}'"))
+    return (
+        select(spec_values.c.key, facet_value.label("value"), func.count(func.distinct(spec_values.c.product_id)))
+        .where(func.jsonb_typeof(spec_values.c.value).in_(FACET_VALUE_TYPES))
+        .group_by(spec_values.c.key, facet_value)
+        .order_by(spec_values.c.key, func.count(func.distinct(spec_values.c.product_id)).desc(), facet_value)
+    )
+
+def format_facets(rows: list) -> dict[str, list[dict[str, any]]]:
+    """Groups (spec name, value, product count) rows into {spec name: [{"value", "count"}, ...]}."""
+    facets: dict[str, list[dict[str, any]]] = {}
+    for spec_name, value, product_count in rows:
+        facets.setdefault(spec_name, []).append({"value": value, "count": product_count})
+    return facets
+
+@track_queries
+def get_category_facets(
+    session: Session,
+    category: str,
+    query: str | None = None,
+    spec_filters: dict[str, list[str]] | None = None,
+) -> dict[str, list[dict[str, any]]]:
+    """Returns the spec values of a category's products with their product counts, for filtered browsing."""
+    rows = session.execute(build_category_facets_stmt(category, query, spec_filters)).all()
+    return format_facets(rows)
+
+# Fingerprint queries: one aggregate row per response, used to compute ETags
+# without loading the variant and price-history graph.
+
+def build_product_fingerprint_stmt(slug: str) -> Select:
+    """Aggregates the latest scrape time and current price record of a product's variants."""
+    return (
+        select(
+            Product.id,
+            Product.created_at,
+            func.count(func.distinct(ProductVariant.id)),
+            func.max(ProductVariant.last_scraped_at),
+            # every new price record becomes its variant's current one, so this also versions the price history
+            func.max(ProductVariant.current_price_record_id),
         )
-        stmt = stmt.join(subq, Product.id == subq.c.product_id)
-        order_by_clause = asc(subq.c.min_price) if sort == "price-asc" else desc(subq.c.min_price)
-    elif sort == "created-desc":
-        order_by_clause = desc(Product.id)
-    elif sort == "created-asc":
-        order_by_clause = asc(Product.id)
-    elif sort == "name-desc":
-        order_by_clause = desc(Product.name)
-    else: 
-        order_by_clause = asc(Product.name)
+        .outerjoin(ProductVariant, ProductVariant.product_id == Product.id)
+        .where(Product.slug == slug)
+        .group_by(Product.id)
+    )
 
-    final_stmt = (
-        stmt.order_by(order_by_clause)
-        .offset(offset)
-        .limit(limit)
-        .options(
-            selectinload(Product.variants)
-            .selectinload(ProductVariant.latest_lowest_price_record)
+def build_variants_fingerprint_stmt(variant_ids: list[int]) -> Select:
+    """Aggregates the latest scrape time and current price record of the given variants."""
+    return (
+        select(
+            func.count(func.distinct(ProductVariant.id)),
+            func.max(ProductVariant.last_scraped_at),
+            func.max(ProductVariant.current_price_record_id),
         )
+        .where(ProductVariant.id.in_(variant_ids))
+    )
+
+def build_catalog_fingerprint_stmt() -> Select:
+    """
+    Versions the whole catalog for the search, category and facet ETags, without applying their filters.
+    Every catalog write inserts a product or variant or bumps a variant's last_scraped_at (a price change
+    always comes with one), and each max() is a single lookup at the end of its index.
+    """
+    return select(
+        select(func.max(Product.id)).scalar_subquery(),
+        select(func.max(ProductVariant.id)).scalar_subquery(),
+        select(func.max(ProductVariant.last_scraped_at)).scalar_subquery(),
     )
-    
-    products = session.execute(final_stmt).scalars().unique().all()
-    
-    return {"data": products, "total": total_count}
 
+@track_queries
 def get_parent_product_by_name(session: Session, name: str) -> Product:
     """Fetches a single parent product by its exact name."""
     stmt = select(Product).options(selectinload(Product.variants)).where(Product.name == name)
     result = session.execute(stmt).scalars().first()
     return result
 
+@track_queries
 def get_product_variant_by_url(session: Session, url: str) -> ProductVariant:
     """Fetches a single product variant by its source URL."""
     stmt = select(ProductVariant).where(ProductVariant.source_url == url)
     result = session.execute(stmt).scalars().first()
     return result
 
+@track_queries
+def get_known_variant_content_hashes(session: Session, urls: list[str]) -> dict[str, str | None]:
+    """Maps the URLs among `urls` that already belong to a product variant to the content hash of their last scrape."""
+    if not urls:
+        return {}
+    stmt = select(ProductVariant.source_url, ProductVariant.content_hash).where(ProductVariant.source_url.in_(urls))
+    return dict(session.execute(stmt).all())
+
+def build_fresh_products_stmt(urls: list[str], cache_duration_hours: int) -> Select:
+    """
+    Builds the cache check of read_products_from_db: every parent product with a variant among `urls`
+    scraped within the cache duration, paired with the fresh URLs it was found by.
+    The freshness predicate runs in SQL against the database clock.
+    """
+    is_fresh = ProductVariant.last_scraped_at >= func.now() - timedelta(hours=cache_duration_hours)
+    return (
+        select(Product, func.array_agg(ProductVariant.source_url))
+        .join(ProductVariant, ProductVariant.product_id == Product.id)
+        .where(ProductVariant.source_url.in_(urls), is_fresh)
+        .group_by(Product.id)
+        .options(
+            load_only(
+                Product.id,
+                Product.name,
+                Product.slug,
+                Product.category,
+                Product.common_specs
+            ),
+            selectinload(Product.variants).load_only(
+                ProductVariant.id,
+                ProductVariant.product_id,
+                ProductVariant.source_url,
+                ProductVariant.image_url,
+                ProductVariant.availability,
+                ProductVariant.variant_specs,
+                ProductVariant.current_price_record_id,
+                ProductVariant.current_price_recorded_at,
+            ),
+            selectinload(Product.variants).selectinload(ProductVariant.latest_lowest_price_record).load_only(
+                PriceHistory.price,
+                PriceHistory.currency
+            )
+        )
+    )
+
+@track_queries
 def read_products_from_db(
     urls: list[str], 
-    cache_duration_hours: int = 1080
+    cache_duration_hours: int = 1080,
+    session: Session | None = None,
 ) -> tuple[list[Product], list[str]]:
     """
     Reads a list of product variants from the DB by URL, returning fresh data and a list of stale/missing URLs.
 
-    This function checks if a variant was scraped recently. If it's "fresh", it returns the full
-    parent Product object. If it's "stale" or not found, it adds the URL to a list
-    to be re-scraped.
+    A variant is "fresh" if it was scraped within the cache duration, in which case its full parent
+    Product object is returned. Stale and unknown URLs are returned to be re-scraped.
+    Runs in the caller's session if one is given, otherwise in a short-lived one of its own.
     """
     if not urls:
         return [], []
 
     print(f"\n[DB Read] Checking cache for {len(urls)} URLs...")
-    cache_duration = timedelta(hours=cache_duration_hours)
-
-    fresh_parent_product_ids: set[int] = set()
-    freshly_found_urls: set[str] = set()
-    with SessionLocal() as session:
-        stmt = (
-            select(ProductVariant)
-            .options(
-                selectinload(ProductVariant.parent_product).load_only(Product.id)
-            )
-            .where(ProductVariant.source_url.in_(urls))
-        )
-        query_results = session.execute(stmt).scalars().all()
-
-        for variant in query_results:
-            is_stale = (datetime.now(timezone.utc) - variant.last_scraped_at) > cache_duration
-            
-            if is_stale:
-                print(f"  - Stale URL: {variant.source_url}. (Queuing for re-scrape)")
-                continue
-            
-            fresh_parent_product_ids.add(variant.parent_product.id)
-            freshly_found_urls.add(variant.source_url)
-
-        found_products: list[Product] = []
-        if fresh_parent_product_ids:
-            # now fetch the full product objects with the desired structure
-            stmt_products = (
-                select(Product)
-                .where(Product.id.in_(list(fresh_parent_product_ids)))
-                .options(
-                    load_only(
-                        Product.id,
-                        Product.name,
-                        Product.slug,
-                        Product.category,
-                        Product.common_specs
-                    ),
-                    selectinload(Product.variants).load_only(
-                        ProductVariant.id,
-                        ProductVariant.product_id,
-                        ProductVariant.source_url,
-                        ProductVariant.image_url,
-                        ProductVariant.availability,
-                        ProductVariant.variant_specs,
-                    ),
-                    selectinload(Product.variants).selectinload(ProductVariant.latest_lowest_price_record).load_only(
-                        PriceHistory.price,
-                        PriceHistory.currency
-                    )
-                )
-            )
-            found_products = session.execute(stmt_products).scalars().all()
+    stmt = build_fresh_products_stmt(urls, cache_duration_hours)
+    if session is None:
+        with SessionLocal() as own_session:
+            query_results = own_session.execute(stmt).all()
+    else:
+        query_results = session.execute(stmt).all()
 
+    found_products: list[Product] = [product for product, _ in query_results]
+    freshly_found_urls: set[str] = {url for _, fresh_urls in query_results for url in fresh_urls}
 
     all_input_urls = set(urls)
     urls_to_scrape = list(all_input_urls - freshly_found_urls)
@@ -350,29 +1050,42 @@ def read_products_from_db(
 
     return found_products, urls_to_scrape
 
+def build_schema_by_product_category_stmt(category: str) -> Select:
+    """Builds the query behind get_schema_by_product_category, shared with its async version."""
+    return select(ProductCategorySchema.schema_definition).where(ProductCategorySchema.product_category == category)
+
+@track_queries
 def get_schema_by_product_category(session: Session, category: str) -> dict[str, any]:
     """Retrieves the current schema for a given product category."""
-    stmt = select(ProductCategorySchema.schema_definition).where(ProductCategorySchema.product_category == category)
-    result = session.execute(stmt).scalars().first()
+    result = session.execute(build_schema_by_product_category_stmt(category)).scalars().first()
     return result
 
 
 
-def get_all_categories(session: Session) -> list[dict[str, str]]:
-    """Return distinct product categories with URL slugs."""
-    stmt = (
+def build_all_categories_stmt() -> Select:
+    """Builds the query behind get_all_categories, shared with its async version."""
+    return (
         select(Product.category)
         .where(Product.category.is_not(None))
         .distinct()
         .order_by(Product.category.asc())
     )
-    categories: list[str] = session.execute(stmt).scalars().all()
+
+def format_categories(categories: list[str]) -> list[dict[str, str]]:
+    """Pairs each category name with its URL slug, skipping blank names."""
     return [
         {"name_bg": category, "slug": slugify(category)}
         for category in categories
         if isinstance(category, str) and category.strip()
     ]
 
+@track_queries
+def get_all_categories(session: Session) -> list[dict[str, str]]:
+    """Return distinct product categories with URL slugs."""
+    categories: list[str] = session.execute(build_all_categories_stmt()).scalars().all()
+    return format_categories(categories)
+
+@track_queries
 def update_product_variant(
     session: Session,
     variant: ProductVariant,
@@ -381,8 +1094,9 @@ def update_product_variant(
 ) -> None:
     """Updates a product's dynamic data (price and availability) based on fresh scrape data."""
     
-    latest_price = variant.price_history[-1].price if variant.price_history else None
-    if  latest_price != Decimal(new_price):
+    latest_price = variant.current_price
+    price_changed = latest_price != Decimal(str(new_price))
+    if price_changed:
         print(f"  [DB CRUD] Price changed for '{variant.slug}'. Old: {latest_price}, New: {new_price}")
         new_price_record = PriceHistory(price=new_price, variant_id=variant.id)
         session.add(new_price_record)
@@ -393,6 +1107,8 @@ def update_product_variant(
 
     variant.last_scraped_at = func.now()
     try:
+        if price_changed:
+            set_current_price_record(session, variant, new_price_record)
         session.commit()
     except IntegrityError:
         print(f"  [DB] Integrity error (likely a race condition). Rolling back.")
@@ -400,4 +1116,6 @@ def update_product_variant(
     except Exception as e:
         print(f"  [DB] An unexpected error occurred: {e}. Rolling back.")
         session.rollback()
-        raise
\ No newline at end of file
+        raise
+
+    invalidate_product_responses(session, variant.product_id)
@@ -1,14 +1,18 @@
 from slugify import slugify
-import random
-import string
 import os
 from dotenv import load_dotenv
 load_dotenv()
 
-from sqlalchemy import create_engine, inspect
+from sqlalchemy import create_engine, inspect, select, or_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 
 from .models import Product, ProductVariant, Base 
+from .migrations import run_migrations
+from .search import detect_trigram_search
+from .partitions import run_price_history_maintenance
+from .instrumentation import instrument_engine
 
 from typing import Type
 
@@ -18,33 +22,41 @@ DB_NAME = os.getenv("DB_NAME")
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 
+# each engine (sync for scrapes and writes, async for the API) keeps its own pool of this size
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT_SECONDS = int(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+# recycle connections before server or proxy idle timeouts close them under us
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+POOL_OPTIONS = {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT_SECONDS,
+    "pool_recycle": DB_POOL_RECYCLE_SECONDS,
+    "pool_pre_ping": DB_POOL_PRE_PING,
+}
+
 DATABASE_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?client_encoding=utf8"
+# asyncpg always talks UTF-8 and does not accept the client_encoding option
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-engine = create_engine(DATABASE_URL)
+engine = create_engine(DATABASE_URL, **POOL_OPTIONS)
+instrument_engine(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# used by the read-only API endpoints, so they do not hold a threadpool slot while waiting on Postgres
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **POOL_OPTIONS)
+instrument_engine(async_engine.sync_engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 BaseModel = Type[Product | ProductVariant]
 
-def generate_unique_slug(
-    session: Session,
-    model: BaseModel,
-    source_data: str | dict[str, str],
-    product_id: int = None
-) -> str:
-    """
-    Generates a unique slug for a given SQLAlchemy model.
+SLUG_ALLOCATION_MAX_ATTEMPTS = 5
 
-    - If source_data is a string, it slugifies the string.
-    - If source_data is a dictionary, it combines and sorts the values to create a slug.
-    - It ensures the generated slug is unique within the specified model's table.
-    
-    Args:
-        session: The SQLAlchemy session object.
-        model: The SQLAlchemy model class (e.g., Product or ProductVariant).
-        source_data: The data to create the slug from (a string name or a dict of specs).
-        product_id: Optional. For ProductVariant, this is the parent product's ID
-                    to ensure the slug is unique *within that product's variants*.
-    """
+def build_base_slug(source_data: str | dict[str, str]) -> str:
+    """Builds the unslugified base of a slug from a name or from a dict of specs."""
     base_slug = ""
     
     if isinstance(source_data, str):
@@ -56,22 +68,64 @@ def generate_unique_slug(
         sorted_keys = sorted(source_data.keys())
         slug_parts = [slugify(str(source_data.get(key, ''))) for key in sorted_keys]
         base_slug = "-".join(part for part in slug_parts if part)
-    
-    slug = slugify(base_slug, max_length=64)
-    while True:
-        query = session.query(model.id).filter(model.slug == slug)
-
-        if model is ProductVariant and product_id is not None:
-            query = query.filter(ProductVariant.product_id == product_id)
-            
-        existing = query.first()
-        
-        if not existing:
-            return slug
-        
-        # Generate a new slug with random suffix
-        random_suffix = ''.join(random.choices(string.ascii_lowercase + string.digits, k=5))
-        slug = f"{base_slug}-{random_suffix}"
+    return base_slug
+
+def allocate_unique_slugs(session: Session, model: BaseModel, source_data: list[str | dict[str, str]]) -> list[str]:
+    """
+    Allocates unique slugs for a batch of new Product or ProductVariant rows with a single query.
+
+    The query fetches every existing slug that equals a base slug of the batch or extends it
+    with a "-" suffix. A free base slug is used as is. Otherwise the smallest free numeric suffix
+    is used ("base-2", "base-3", ...), also skipping slugs given to earlier rows of the same batch.
+    A concurrent writer can still take a slug between this query and the insert. The unique
+    constraint catches that, and insert_with_unique_slug allocates again.
+    """
+    base_slugs = [slugify(build_base_slug(data), max_length=64) for data in source_data]
+    if not base_slugs:
+        return []
+
+    distinct_bases = set(base_slugs)
+    # served by the varchar_pattern_ops index on slug (migration 6)
+    taken_slugs = set(session.execute(
+        select(model.slug).where(or_(
+            model.slug.in_(distinct_bases),
+            *(model.slug.like(f"{base_slug}-%") for base_slug in distinct_bases),
+        ))
+    ).scalars().all())
+
+    slugs = []
+    for base_slug in base_slugs:
+        slug = base_slug
+        suffix = 2
+        while slug in taken_slugs:
+            slug = f"{base_slug}-{suffix}"
+            suffix += 1
+        taken_slugs.add(slug)
+        slugs.append(slug)
+    return slugs
+
+def is_slug_conflict(error: IntegrityError) -> bool:
+    """Tells whether an insert failed on the unique slug index rather than on another constraint."""
+    constraint_name = getattr(getattr(error.orig, "diag", None), "constraint_name", None)
+    return "slug" in (constraint_name or str(error.orig))
+
+def insert_with_unique_slug(session: Session, instance: Product | ProductVariant, source_data: str | dict[str, str]) -> None:
+    """
+    Adds a new Product or ProductVariant with an allocated slug and flushes it inside a savepoint.
+    If a concurrent writer took the slug in the meantime, the savepoint is rolled back and
+    another slug is allocated, up to SLUG_ALLOCATION_MAX_ATTEMPTS times.
+    """
+    for attempt in range(1, SLUG_ALLOCATION_MAX_ATTEMPTS + 1):
+        instance.slug = allocate_unique_slugs(session, type(instance), [source_data])[0]
+        try:
+            with session.begin_nested():
+                session.add(instance)
+                session.flush()
+            return
+        except IntegrityError as e:
+            if not is_slug_conflict(e) or attempt == SLUG_ALLOCATION_MAX_ATTEMPTS:
+                raise
+            print(f"  [DB] Slug '{instance.slug}' was taken by a concurrent insert. Allocating another one.")
 
 def setup_database():
     """Creates all tables defined in models.py if they don't exist."""
@@ -86,7 +140,7 @@ def setup_database():
 def initialize_database_on_first_run():
     """
     Checks if the database tables exist and runs the setup function only
-    on the very first run.
+    on the very first run, then applies any pending schema migrations.
     """
     try:
         inspector = inspect(engine)
@@ -97,13 +151,16 @@ def initialize_database_on_first_run():
         # get table names that actually exist in the database
         existing_tables = set(inspector.get_table_names())
 
-        if required_tables.issubset(existing_tables):
-            return 
-        else:
+        if not required_tables.issubset(existing_tables):
             missing = required_tables - existing_tables
             print(f"[Startup] Missing tables detected: {missing}.")
             setup_database()
 
+        run_migrations(engine)
+        # archiving waits for the periodic maintenance, but inserts need the current partitions right away
+        run_price_history_maintenance(engine, archive=False)
+        detect_trigram_search(engine)
+
     except Exception as e:
         print(f"[Startup] FATAL: Could not connect to the database to check tables: {e}")
         print("[Startup] Please ensure the database server is running and accessible.")
@@ -114,4 +171,8 @@ def get_db():
     try:
         yield db # provide the session to the FastAPI route
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db # provide the async session to the FastAPI route
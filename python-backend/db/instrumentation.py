@@ -0,0 +1,130 @@
+import bisect
+import functools
+import inspect
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, TypedDict
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# statements that take longer than this are printed with the CRUD function that issued them
+DB_SLOW_QUERY_THRESHOLD_MS = float(os.getenv("DB_SLOW_QUERY_THRESHOLD_MS", "500"))
+SLOW_QUERY_LOG_MAX_SQL_LENGTH = 500
+# upper bounds of the latency histogram buckets in milliseconds; slower statements land in the last, open bucket
+LATENCY_BUCKETS_MS = [1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+UNTAGGED_QUERY = "untagged"
+
+# the CRUD function currently issuing statements, set by track_queries
+current_query_tag: ContextVar[str] = ContextVar("current_query_tag", default=UNTAGGED_QUERY)
+
+class QueryLatencyStats(TypedDict):
+    count: int
+    total_ms: float
+    max_ms: float
+    # statement counts per bucket of LATENCY_BUCKETS_MS, plus one for everything slower
+    buckets: list[int]
+
+class QueryLatencyHistograms:
+    """Per-tag histograms of statement latencies, shared by the sync and async engines."""
+
+    def __init__(self):
+        self._stats: dict[str, QueryLatencyStats] = {}
+        self._lock = threading.Lock()
+
+    def record(self, tag: str, elapsed_ms: float) -> None:
+        with self._lock:
+            stats = self._stats.get(tag)
+            if stats is None:
+                stats = {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "buckets": [0] * (len(LATENCY_BUCKETS_MS) + 1)}
+                self._stats[tag] = stats
+            stats["count"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            stats["buckets"][bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+
+    def snapshot(self) -> dict[str, QueryLatencyStats]:
+        with self._lock:
+            return {tag: {**stats, "buckets": list(stats["buckets"])} for tag, stats in self._stats.items()}
+
+query_latency_histograms = QueryLatencyHistograms()
+
+def track_queries(crud_function: Callable) -> Callable:
+    """Tags every statement the decorated CRUD function (sync or async) runs with its name."""
+    tag = f"{crud_function.__module__.rsplit('.', 1)[-1]}.{crud_function.__name__}"
+
+    if inspect.iscoroutinefunction(crud_function):
+        @functools.wraps(crud_function)
+        async def async_wrapper(*args, **kwargs):
+            token = current_query_tag.set(tag)
+            try:
+                return await crud_function(*args, **kwargs)
+            finally:
+                current_query_tag.reset(token)
+        return async_wrapper
+
+    @functools.wraps(crud_function)
+    def wrapper(*args, **kwargs):
+        token = current_query_tag.set(tag)
+        try:
+            return crud_function(*args, **kwargs)
+        finally:
+            current_query_tag.reset(token)
+    return wrapper
+
+def before_cursor_execute(connection, cursor, statement, parameters, context, executemany) -> None:
+    connection.info.setdefault("query_start_times", []).append(time.perf_counter())
+
+def after_cursor_execute(connection, cursor, statement, parameters, context, executemany) -> None:
+    start_times = connection.info.get("query_start_times")
+    if not start_times:
+        return
+    elapsed_ms = (time.perf_counter() - start_times.pop()) * 1000
+    tag = current_query_tag.get()
+    query_latency_histograms.record(tag, elapsed_ms)
+    if elapsed_ms >= DB_SLOW_QUERY_THRESHOLD_MS:
+        compact_statement = " ".join(statement.split())[:SLOW_QUERY_LOG_MAX_SQL_LENGTH]
+        print(f"[DB Timing] Slow query in {tag} ({elapsed_ms:.1f} ms): {compact_statement}")
+
+def handle_error(exception_context) -> None:
+    # a failed statement never reaches after_cursor_execute, so its start time is dropped here
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_start_times"):
+        connection.info["query_start_times"].pop()
+
+def instrument_engine(engine: Engine) -> None:
+    """Records the latency of every statement run through the engine (for async engines, pass .sync_engine)."""
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine, "handle_error", handle_error)
+
+def get_pool_report(engine: Engine) -> dict[str, int]:
+    """Reports how many pooled connections are in use, to size DB_POOL_SIZE and DB_MAX_OVERFLOW."""
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        # negative while fewer connections than pool_size have been opened
+        "overflow": pool.overflow(),
+    }
+
+def get_query_latency_report() -> list[dict[str, any]]:
+    """Summarizes the histograms per CRUD function, slowest total time first."""
+    report = []
+    for tag, stats in query_latency_histograms.snapshot().items():
+        bucket_labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        report.append({
+            "function": tag,
+            "count": stats["count"],
+            "total_ms": round(stats["total_ms"], 2),
+            "mean_ms": round(stats["total_ms"] / stats["count"], 2),
+            "max_ms": round(stats["max_ms"], 2),
+            "histogram": dict(zip(bucket_labels, stats["buckets"])),
+        })
+    return sorted(report, key=lambda entry: entry["total_ms"], reverse=True)
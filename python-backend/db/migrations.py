@@ -0,0 +1,318 @@
+from typing import Callable, TypedDict
+
+from sqlalchemy import bindparam, text, update, select
+from sqlalchemy.engine import Connection, Engine
+
+from .models import Product
+from .search import build_product_search_text
+from .rollups import backfill_price_rollups
+from .partitions import ensure_price_history_partitions, is_price_history_partitioned
+
+# Versioned schema migrations, applied in order at startup by run_migrations.
+# create_all only creates missing tables, so every change to an existing table (a new column,
+# index or backfill) is added here as a new migration with the next version number.
+# Migrations must be idempotent, because a fresh database already gets the current models from create_all.
+
+# arbitrary key of the Postgres advisory lock that keeps concurrently starting workers from migrating at the same time
+MIGRATION_LOCK_KEY = 740_112_001
+SEARCH_TEXT_BACKFILL_BATCH_SIZE = 1000
+# rows copied per transaction while migration 8 moves price_history into partitions
+PRICE_HISTORY_COPY_BATCH_SIZE = 10000
+# the secondary indexes of price_history, which migration 8 recreates on the partitioned table
+PRICE_HISTORY_INDEXES = {
+    "ix_price_history_variant_id": "(variant_id)",
+    "ix_price_history_currency": "(currency)",
+    "ix_price_history_variant_id_recorded_at": "(variant_id, recorded_at DESC)",
+}
+
+class Migration(TypedDict):
+    version: int
+    description: str
+    upgrade: Callable[[Connection], None]
+    # non-transactional migrations run in autocommit mode, which CREATE INDEX CONCURRENTLY requires
+    transactional: bool
+    # a failed optional migration is logged and retried on the next startup instead of stopping it
+    optional: bool
+
+MIGRATIONS: list[Migration] = []
+
+def migration(version: int, description: str, transactional: bool = True, optional: bool = False):
+    """Registers the decorated function as the upgrade step of a schema version."""
+    def register(upgrade: Callable[[Connection], None]) -> Callable[[Connection], None]:
+        MIGRATIONS.append({
+            "version": version,
+            "description": description,
+            "upgrade": upgrade,
+            "transactional": transactional,
+            "optional": optional,
+        })
+        return upgrade
+    return register
+
+def create_index_concurrently(connection: Connection, index_name: str, definition: str) -> None:
+    """
+    Builds an index without blocking writes to the table. An invalid index left behind
+    by an interrupted build is dropped first, since IF NOT EXISTS would otherwise keep it.
+    """
+    is_valid = connection.execute(
+        text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:index_name)"),
+        {"index_name": index_name},
+    ).scalar()
+    if is_valid:
+        # also covers indexes create_all already built on a partitioned table, which cannot be built concurrently
+        return
+    if is_valid is False:
+        print(f"[Migrations] Dropping invalid index '{index_name}' left by an interrupted build.")
+        connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}"))
+    connection.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON {definition}"))
+
+@migration(1, "Add the product search text, its generated tsvector and a GIN index")
+def add_product_search_columns(connection: Connection) -> None:
+    connection.execute(text("ALTER TABLE products ADD COLUMN IF NOT EXISTS search_text TEXT"))
+    connection.execute(text(
+        "ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('simple', coalesce(search_text, ''))) STORED"
+    ))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_products_search_vector ON products USING gin (search_vector)"))
+
+    products_table = Product.__table__
+    while True:
+        rows = connection.execute(
+            select(products_table.c.id, products_table.c.name, products_table.c.brand)
+            .where(products_table.c.search_text.is_(None))
+            .limit(SEARCH_TEXT_BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        connection.execute(
+            update(products_table)
+            .where(products_table.c.id == bindparam("product_id"))
+            .values(search_text=bindparam("new_search_text")),
+            [
+                {"product_id": row.id, "new_search_text": build_product_search_text(row.name, row.brand)}
+                for row in rows
+            ],
+        )
+        print(f"[Migrations] Backfilled search text for {len(rows)} products.")
+
+@migration(2, "Enable pg_trgm and add a trigram index on the product search text", optional=True)
+def add_product_search_trigram_index(connection: Connection) -> None:
+    connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_products_search_text_trgm ON products USING gin (search_text gin_trgm_ops)"
+    ))
+
+@migration(3, "Add the denormalized current price columns and the current price record pointer")
+def add_current_price_columns(connection: Connection) -> None:
+    connection.execute(text("ALTER TABLE product_variants ADD COLUMN IF NOT EXISTS current_price NUMERIC(10, 2)"))
+    connection.execute(text("ALTER TABLE product_variants ADD COLUMN IF NOT EXISTS current_price_record_id INTEGER"))
+    connection.execute(text("ALTER TABLE products ADD COLUMN IF NOT EXISTS min_current_price NUMERIC(10, 2)"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_product_variants_current_price ON product_variants (current_price)"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_products_min_current_price_id ON products (min_current_price, id)"))
+
+    backfilled_variants = connection.execute(text("""
+        UPDATE product_variants AS pv
+        SET current_price = latest.price, current_price_record_id = latest.id
+        FROM (
+            SELECT DISTINCT ON (variant_id) variant_id, id, price
+            FROM price_history
+            ORDER BY variant_id, recorded_at DESC, id DESC
+        ) AS latest
+        WHERE pv.id = latest.variant_id AND pv.current_price_record_id IS NULL
+    """)).rowcount
+    if backfilled_variants:
+        connection.execute(text("""
+            UPDATE products AS p
+            SET min_current_price = prices.min_current_price
+            FROM (
+                SELECT product_id, min(current_price) AS min_current_price
+                FROM product_variants
+                GROUP BY product_id
+            ) AS prices
+            WHERE p.id = prices.product_id
+        """))
+        print(f"[Migrations] Backfilled the current price record of {backfilled_variants} variants.")
+
+@migration(4, "Add the latest-price, freshness and category listing indexes", transactional=False)
+def add_hot_query_indexes(connection: Connection) -> None:
+    create_index_concurrently(
+        connection, "ix_price_history_variant_id_recorded_at", "price_history (variant_id, recorded_at DESC)"
+    )
+    create_index_concurrently(connection, "ix_product_variants_last_scraped_at", "product_variants (last_scraped_at)")
+    create_index_concurrently(connection, "ix_products_category_created_at", "products (category, created_at)")
+
+@migration(5, "Add jsonb_path_ops GIN indexes on the common and variant specs", transactional=False)
+def add_spec_filter_indexes(connection: Connection) -> None:
+    create_index_concurrently(connection, "ix_products_common_specs", "products USING gin (common_specs jsonb_path_ops)")
+    create_index_concurrently(
+        connection, "ix_product_variants_variant_specs", "product_variants USING gin (variant_specs jsonb_path_ops)"
+    )
+
+@migration(6, "Add varchar_pattern_ops indexes for the slug prefix lookups", transactional=False)
+def add_slug_prefix_indexes(connection: Connection) -> None:
+    # the unique slug indexes use the database collation, which cannot serve LIKE 'prefix%'
+    create_index_concurrently(connection, "ix_products_slug_pattern", "products (slug varchar_pattern_ops)")
+    create_index_concurrently(
+        connection, "ix_product_variants_slug_pattern", "product_variants (slug varchar_pattern_ops)"
+    )
+
+@migration(7, "Add the daily and weekly price history rollups and backfill them")
+def add_price_history_rollups(connection: Connection) -> None:
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS price_history_rollups (
+            variant_id INTEGER NOT NULL REFERENCES product_variants (id) ON DELETE CASCADE,
+            resolution VARCHAR(10) NOT NULL,
+            bucket_start DATE NOT NULL,
+            min_price NUMERIC(10, 2) NOT NULL,
+            max_price NUMERIC(10, 2) NOT NULL,
+            last_price NUMERIC(10, 2) NOT NULL,
+            currency VARCHAR(3) NOT NULL,
+            last_recorded_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            PRIMARY KEY (variant_id, resolution, bucket_start)
+        )
+    """))
+    backfilled_buckets = backfill_price_rollups(connection)
+    if backfilled_buckets:
+        print(f"[Migrations] Backfilled {backfilled_buckets} price history rollup buckets.")
+
+@migration(8, "Partition price_history by month and point variants at their record's partition", transactional=False)
+def partition_price_history(connection: Connection) -> None:
+    """
+    Moves price_history into a partitioned table without holding up the scrapers for the whole copy:
+    the rows are copied in short batches while the old table keeps taking writes, and inserts are only
+    blocked during the final transaction, which copies the rows added meanwhile and swaps the tables.
+    Reads wait only for the swap itself. The migration resumes where it stopped if interrupted.
+    """
+    connection.execute(text(
+        "ALTER TABLE product_variants ADD COLUMN IF NOT EXISTS current_price_recorded_at TIMESTAMP WITH TIME ZONE"
+    ))
+    connection.execute(text("""
+        UPDATE product_variants AS pv
+        SET current_price_recorded_at = ph.recorded_at
+        FROM price_history AS ph
+        WHERE ph.id = pv.current_price_record_id AND pv.current_price_recorded_at IS NULL
+    """))
+    # a fresh database already gets the partitioned table from create_all
+    if is_price_history_partitioned(connection):
+        return
+
+    engine = connection.engine
+    # the new table is built next to the live one and takes over its name, constraints and sequence at the swap
+    with engine.begin() as setup_connection:
+        setup_connection.execute(text("""
+            CREATE TABLE IF NOT EXISTS price_history_partitioned (
+                id INTEGER NOT NULL DEFAULT nextval('price_history_id_seq'),
+                variant_id INTEGER NOT NULL,
+                price NUMERIC(10, 2) NOT NULL,
+                currency VARCHAR(3) NOT NULL,
+                recorded_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+                CONSTRAINT price_history_partitioned_pkey PRIMARY KEY (id, recorded_at),
+                CONSTRAINT price_history_partitioned_variant_id_fkey
+                    FOREIGN KEY (variant_id) REFERENCES product_variants (id)
+            ) PARTITION BY RANGE (recorded_at)
+        """))
+        first_month = setup_connection.execute(text(
+            "SELECT date_trunc('month', min(recorded_at) AT TIME ZONE 'UTC')::date FROM price_history"
+        )).scalar()
+        ensure_price_history_partitions(setup_connection, first_month, parent="price_history_partitioned")
+        # created on the empty parent, so every partition is indexed as it fills and the swap builds nothing
+        for index_name, definition in PRICE_HISTORY_INDEXES.items():
+            setup_connection.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {index_name}_partitioned ON price_history_partitioned {definition}"
+            ))
+
+    # the SHARE lock waits for in-flight inserts, so every id up to the high-water mark is committed.
+    # Later inserts get higher ids from the sequence and are left to the final transaction.
+    with engine.begin() as high_water_connection:
+        high_water_connection.execute(text("LOCK TABLE price_history IN SHARE MODE"))
+        high_water_id = high_water_connection.execute(text("SELECT coalesce(max(id), 0) FROM price_history")).scalar()
+    copied_id = connection.execute(text("SELECT coalesce(max(id), 0) FROM price_history_partitioned")).scalar()
+    while copied_id < high_water_id:
+        # each batch commits on its own, walking the old primary key
+        copied_id = connection.execute(text(f"""
+            WITH batch AS (
+                INSERT INTO price_history_partitioned (id, variant_id, price, currency, recorded_at)
+                SELECT id, variant_id, price, currency, recorded_at FROM price_history
+                WHERE id > :copied_id AND id <= :high_water_id
+                ORDER BY id
+                LIMIT {PRICE_HISTORY_COPY_BATCH_SIZE}
+                RETURNING id
+            )
+            SELECT coalesce(max(id), :high_water_id) FROM batch
+        """), {"copied_id": copied_id, "high_water_id": high_water_id}).scalar()
+        print(f"[Migrations] Copied price records up to id {copied_id} of {high_water_id}.")
+
+    with engine.begin() as swap_connection:
+        # EXCLUSIVE still lets the API read prices while the last rows are copied
+        swap_connection.execute(text("LOCK TABLE price_history IN EXCLUSIVE MODE"))
+        # price records are append-only (variants are never deleted), so only new rows are left to copy
+        late_records = swap_connection.execute(text("""
+            INSERT INTO price_history_partitioned (id, variant_id, price, currency, recorded_at)
+            SELECT id, variant_id, price, currency, recorded_at FROM price_history WHERE id > :high_water_id
+        """), {"high_water_id": high_water_id}).rowcount
+        swap_connection.execute(text("ALTER SEQUENCE price_history_id_seq OWNED BY NONE"))
+        swap_connection.execute(text("DROP TABLE price_history"))
+        swap_connection.execute(text("ALTER TABLE price_history_partitioned RENAME TO price_history"))
+        swap_connection.execute(text(
+            "ALTER TABLE price_history RENAME CONSTRAINT price_history_partitioned_pkey TO price_history_pkey"
+        ))
+        swap_connection.execute(text(
+            "ALTER TABLE price_history RENAME CONSTRAINT price_history_partitioned_variant_id_fkey "
+            "TO price_history_variant_id_fkey"
+        ))
+        for index_name in PRICE_HISTORY_INDEXES:
+            swap_connection.execute(text(f"ALTER INDEX {index_name}_partitioned RENAME TO {index_name}"))
+        swap_connection.execute(text("ALTER SEQUENCE price_history_id_seq OWNED BY price_history.id"))
+    print(f"[Migrations] Moved price records into monthly partitions, {late_records} of them during the swap.")
+
+@migration(9, "Add the content hash of the last scraped page to product_variants")
+def add_variant_content_hash(connection: Connection) -> None:
+    # existing variants start without a hash, so their next refresh extracts as usual and stores one
+    connection.execute(text("ALTER TABLE product_variants ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)"))
+
+@migration(10, "Add the (name, id) index behind the name sorts", transactional=False)
+def add_product_name_sort_index(connection: Connection) -> None:
+    # the keyset pages of the name sorts compare (name, id), which this index serves in both directions
+    create_index_concurrently(connection, "ix_products_name_id", "products (name, id)")
+
+def get_applied_versions(connection: Connection) -> set[int]:
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+        )
+    """))
+    return set(connection.execute(text("SELECT version FROM schema_migrations")).scalars().all())
+
+def apply_migration(engine: Engine, pending_migration: Migration) -> None:
+    record_version = text("INSERT INTO schema_migrations (version, description) VALUES (:version, :description)")
+    record_params = {"version": pending_migration["version"], "description": pending_migration["description"]}
+    if pending_migration["transactional"]:
+        # the schema change and its version record commit together, or not at all
+        with engine.begin() as connection:
+            pending_migration["upgrade"](connection)
+            connection.execute(record_version, record_params)
+    else:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            pending_migration["upgrade"](connection)
+            connection.execute(record_version, record_params)
+
+def run_migrations(engine: Engine) -> None:
+    """Applies every migration newer than the database's schema version, in order."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock_connection:
+        lock_connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        try:
+            applied_versions = get_applied_versions(lock_connection)
+            for pending_migration in sorted(MIGRATIONS, key=lambda m: m["version"]):
+                if pending_migration["version"] in applied_versions:
+                    continue
+                print(f"[Migrations] Applying {pending_migration['version']}: {pending_migration['description']}...")
+                try:
+                    apply_migration(engine, pending_migration)
+                except Exception as e:
+                    if not pending_migration["optional"]:
+                        raise
+                    print(f"[Migrations] Skipped optional migration {pending_migration['version']}, will retry on the next startup: {e}")
+        finally:
+            lock_connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, DECIMAL, TEXT, TIMESTAMP, ForeignKey, select,  and_
-from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy.orm import declarative_base, relationship, remote, foreign, Mapped
+from sqlalchemy import Column, Computed, Date, and_, Index, Integer, String, DECIMAL, TEXT, TIMESTAMP, JSON, ForeignKey
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
+from sqlalchemy.orm import declarative_base, relationship, foreign, Mapped
 from sqlalchemy.sql import func
 
 Base = declarative_base()
@@ -17,6 +17,24 @@ class Product(Base):
     common_specs: Column[JSONB] = Column(JSONB, nullable=False)
     variants: Mapped[list["ProductVariant"]] = relationship("ProductVariant", back_populates="parent_product", cascade="all, delete-orphan")
     created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+    # transliterated, lowercased name and brand, see db/search.py
+    search_text = Column(TEXT, nullable=True)
+    search_vector = Column(TSVECTOR, Computed("to_tsvector('simple', coalesce(search_text, ''))", persisted=True))
+    # lowest current price among the variants, kept up to date by the variant CRUD functions
+    min_current_price: Column[DECIMAL] = Column(DECIMAL(10, 2), nullable=True)
+
+    __table_args__ = (
+        Index("ix_products_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_products_min_current_price_id", "min_current_price", "id"),
+        Index("ix_products_name_id", "name", "id"),
+        Index("ix_products_category_created_at", "category", "created_at"),
+        Index(
+            "ix_products_common_specs", "common_specs",
+            postgresql_using="gin", postgresql_ops={"common_specs": "jsonb_path_ops"},
+        ),
+        Index("ix_products_slug_pattern", "slug", postgresql_ops={"slug": "varchar_pattern_ops"}),
+    )
+
     def __repr__(self):
         return f"<Product(id={self.id}, name='{self.name}')>"
     
@@ -31,7 +49,24 @@ class ProductVariant(Base):
     image_url = Column(String(512), nullable=True)
     variant_specs: Column[JSONB] = Column(JSONB, nullable=False)
     created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
-    last_scraped_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now())
+    last_scraped_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now(), index=True)
+    # price of the most recent price history record
+    current_price: Column[DECIMAL] = Column(DECIMAL(10, 2), nullable=True, index=True)
+    # id of the most recent price history record, maintained by the variant CRUD functions.
+    # There is no foreign key constraint, so price_history can be partitioned and archived independently.
+    current_price_record_id = Column(Integer, nullable=True)
+    # the record's partition key, so looking the record up only touches its own partition
+    current_price_recorded_at = Column(TIMESTAMP(timezone=True), nullable=True)
+    # SHA-256 of the normalized, truncated page markdown of the last scrape; an unchanged page is not extracted again
+    content_hash = Column(String(64), nullable=True)
+
+    __table_args__ = (
+        Index(
+            "ix_product_variants_variant_specs", "variant_specs",
+            postgresql_using="gin", postgresql_ops={"variant_specs": "jsonb_path_ops"},
+        ),
+        Index("ix_product_variants_slug_pattern", "slug", postgresql_ops={"slug": "varchar_pattern_ops"}),
+    )
     # This product variant has a one-to-many relationship with its price history.
     price_history: Mapped[list["PriceHistory"]] = relationship(
         "PriceHistory",
@@ -40,21 +75,10 @@ class ProductVariant(Base):
     )
     latest_lowest_price_record: Mapped['PriceHistory'] = relationship(
         "PriceHistory",
+        # a plain pointer lookup, so eager loading is a single primary key "IN (...)" that prunes partitions
         primaryjoin=lambda: and_(
-            # this part defines the link between the two tables
-            ProductVariant.id == remote(foreign(PriceHistory.variant_id)),
-            
-            # this part identifies the specific remote record we want
-            remote(PriceHistory.id) == (
-                select(PriceHistory.id)
-                .where(PriceHistory.variant_id == ProductVariant.id)
-                .order_by(
-                    PriceHistory.recorded_at.desc()
-                )
-                .limit(1)
-                .correlate(ProductVariant.__table__)
-                .scalar_subquery()
-            )
+            foreign(ProductVariant.current_price_record_id) == PriceHistory.id,
+            foreign(ProductVariant.current_price_recorded_at) == PriceHistory.recorded_at,
         ),
         uselist=False,
         viewonly=True,
@@ -71,14 +95,41 @@ class PriceHistory(Base):
     variant_id = Column(Integer, ForeignKey('product_variants.id'), nullable=False, index=True)
     price: Column[DECIMAL] = Column(DECIMAL(10, 2), nullable=False)
     currency = Column(String(3), nullable=False, default='BGN', index=True)
+    # the partition key, which Postgres requires to be part of the primary key
     recorded_at = Column(
         TIMESTAMP(timezone=True), 
+        primary_key=True,
         nullable=False, 
         server_default=func.now()
     )
     variant: Mapped["ProductVariant"] = relationship("ProductVariant", back_populates="price_history")
+
+    __table_args__ = (
+        # serves the latest-price lookups, which read the newest records of a variant first
+        Index("ix_price_history_variant_id_recorded_at", variant_id, recorded_at.desc()),
+        # monthly partitions, see db/partitions.py
+        {"postgresql_partition_by": "RANGE (recorded_at)"},
+    )
+
     def __repr__(self):
          return f"<PriceHistory(variant_id={self.variant_id}, price={self.price})>"
+
+class PriceHistoryRollup(Base):
+    """Min/max/last price of a variant per day or week, maintained by db/rollups.py."""
+    __tablename__ = 'price_history_rollups'
+
+    variant_id = Column(Integer, ForeignKey('product_variants.id', ondelete='CASCADE'), primary_key=True)
+    # 'daily' or 'weekly', see PRICE_ROLLUP_RESOLUTIONS
+    resolution = Column(String(10), primary_key=True)
+    bucket_start = Column(Date, primary_key=True)
+    min_price: Column[DECIMAL] = Column(DECIMAL(10, 2), nullable=False)
+    max_price: Column[DECIMAL] = Column(DECIMAL(10, 2), nullable=False)
+    last_price: Column[DECIMAL] = Column(DECIMAL(10, 2), nullable=False)
+    currency = Column(String(3), nullable=False)
+    last_recorded_at = Column(TIMESTAMP(timezone=True), nullable=False)
+
+    def __repr__(self):
+        return f"<PriceHistoryRollup(variant_id={self.variant_id}, {self.resolution} from {self.bucket_start})>"
     
 class ProductCategorySchema(Base):
     __tablename__ = 'product_category_schema'
@@ -90,4 +141,50 @@ class ProductCategorySchema(Base):
     updated_at = Column(TIMESTAMP(timezone=True), default=func.now(), onupdate=func.now(), nullable=False)
 
     def __repr__(self):
-        return f"<UniversalProductSchema(id={self.id}, category='{self.product_category}') schema='{self.schema_definition}')>"
\ No newline at end of file
+        return f"<UniversalProductSchema(id={self.id}, category='{self.product_category}') schema='{self.schema_definition}')>"
+
+class AnalysisTask(Base):
+    __tablename__ = 'analysis_tasks'
+
+    # JSONB on Postgres, plain JSON on SQLite so the same table works for both task store backends
+    task_id = Column(String(36), primary_key=True)
+    state = Column(JSON().with_variant(JSONB, 'postgresql'), nullable=False)
+    version = Column(Integer, nullable=False, default=1)
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False)
+    expires_at = Column(TIMESTAMP(timezone=True), nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<AnalysisTask(task_id='{self.task_id}', version={self.version})>"
+
+class AnalysisTaskProducts(Base):
+    __tablename__ = 'analysis_task_products'
+
+    # the product snapshot of a task, kept apart from analysis_tasks so status updates do not rewrite it
+    task_id = Column(String(36), primary_key=True)
+    seq = Column(Integer, nullable=False)
+    data = Column(JSON().with_variant(JSONB, 'postgresql'), nullable=False)
+
+    def __repr__(self):
+        return f"<AnalysisTaskProducts(task_id='{self.task_id}', seq={self.seq})>"
+
+class AnalysisTaskVersion(Base):
+    __tablename__ = 'analysis_task_versions'
+
+    # a single counter row that every task write takes its version from, so versions never restart
+    # when a task expires and is written again
+    name = Column(String(32), primary_key=True)
+    value = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return f"<AnalysisTaskVersion(name='{self.name}', value={self.value})>"
+
+class AnalysisRequest(Base):
+    __tablename__ = 'analysis_requests'
+
+    # maps a normalized search payload hash to the task currently serving it
+    request_key = Column(String(64), primary_key=True)
+    task_id = Column(String(36), nullable=False)
+    expires_at = Column(TIMESTAMP(timezone=True), nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<AnalysisRequest(request_key='{self.request_key}', task_id='{self.task_id}')>"
@@ -0,0 +1,143 @@
+import os
+from datetime import date, datetime, timezone
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from .rollups import build_price_rollup_upsert
+
+# price_history is range-partitioned by month on recorded_at. Partitions are created ahead of time,
+# so inserts never miss one, and partitions older than the retention window are moved out of the
+# hot table once their records are rolled up (see db/rollups.py).
+
+# number of future monthly partitions kept ready beyond the current month
+PRICE_HISTORY_PARTITIONS_AHEAD_MONTHS = int(os.getenv("PRICE_HISTORY_PARTITIONS_AHEAD_MONTHS", "3"))
+# raw price records older than this many months are archived; 0 keeps them forever
+PRICE_HISTORY_RETENTION_MONTHS = int(os.getenv("PRICE_HISTORY_RETENTION_MONTHS", "24"))
+# "archive" moves expired partitions to PRICE_HISTORY_ARCHIVE_SCHEMA, "drop" deletes them
+PRICE_HISTORY_ARCHIVE_MODE = os.getenv("PRICE_HISTORY_ARCHIVE_MODE", "archive")
+PRICE_HISTORY_ARCHIVE_SCHEMA = os.getenv("PRICE_HISTORY_ARCHIVE_SCHEMA", "price_history_archive")
+PRICE_HISTORY_MAINTENANCE_INTERVAL_SECONDS = int(os.getenv("PRICE_HISTORY_MAINTENANCE_INTERVAL_SECONDS", "21600"))
+
+# catches rows outside every monthly partition. After archiving it also keeps the expired
+# records that are still some variant's current price, so the current price pointers stay valid.
+PRICE_HISTORY_DEFAULT_PARTITION = "price_history_default"
+# arbitrary key of the Postgres advisory lock that keeps workers from maintaining partitions at the same time
+PARTITION_MAINTENANCE_LOCK_KEY = 740_112_002
+
+def add_months(month: date, months: int) -> date:
+    month_index = month.year * 12 + month.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+def month_start_utc(month: date) -> datetime:
+    # partition bounds are UTC months, like the rollup buckets, whatever the session time zone
+    return datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+
+def get_partition_name(month: date) -> str:
+    return f"price_history_y{month.year}m{month.month:02d}"
+
+def is_price_history_partitioned(connection: Connection) -> bool:
+    return connection.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('price_history'))"
+    )).scalar()
+
+def get_monthly_partitions(connection: Connection) -> list[tuple[str, date]]:
+    """Returns the name and month of every monthly partition attached to price_history, oldest first."""
+    partition_names = connection.execute(text("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = to_regclass('price_history')
+    """)).scalars().all()
+    partitions = []
+    for partition_name in partition_names:
+        if partition_name == PRICE_HISTORY_DEFAULT_PARTITION:
+            continue
+        year, month = partition_name.removeprefix("price_history_y").split("m")
+        partitions.append((partition_name, date(int(year), int(month), 1)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+def create_monthly_partition(connection: Connection, month: date, parent: str = "price_history") -> None:
+    connection.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {get_partition_name(month)} PARTITION OF {parent} "
+        f"FOR VALUES FROM ('{month_start_utc(month).isoformat()}') TO ('{month_start_utc(add_months(month, 1)).isoformat()}')"
+    ))
+
+def ensure_price_history_partitions(
+    connection: Connection, first_month: date | None = None, parent: str = "price_history"
+) -> None:
+    """
+    Creates the monthly partitions from `first_month` (by default the current month) through
+    PRICE_HISTORY_PARTITIONS_AHEAD_MONTHS months ahead, and the default partition.
+    `parent` is only overridden by the migration that builds the partitioned table under a temporary name.
+    """
+    current_month = datetime.now(timezone.utc).date().replace(day=1)
+    month = first_month or current_month
+    last_month = add_months(current_month, PRICE_HISTORY_PARTITIONS_AHEAD_MONTHS)
+    while month <= last_month:
+        create_monthly_partition(connection, month, parent)
+        month = add_months(month, 1)
+    connection.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {PRICE_HISTORY_DEFAULT_PARTITION} PARTITION OF {parent} DEFAULT"
+    ))
+
+def archive_price_history_partition(connection: Connection, partition_name: str, month: date) -> None:
+    """
+    Moves one expired monthly partition out of price_history, inside the caller's transaction.
+    Its records are rolled up first, and the ones still pointed at as a current price are kept.
+    """
+    # the rollup merge is idempotent, so records that were already rolled up are not counted twice
+    connection.execute(
+        build_price_rollup_upsert("WHERE ph.recorded_at >= :month_start AND ph.recorded_at < :month_end"),
+        {"month_start": month_start_utc(month), "month_end": month_start_utc(add_months(month, 1))},
+    )
+    connection.execute(text(f"ALTER TABLE price_history DETACH PARTITION {partition_name}"))
+    # no monthly partition covers this range anymore, so the kept records land in the default partition
+    kept_records = connection.execute(text(f"""
+        INSERT INTO price_history (id, variant_id, price, currency, recorded_at)
+        SELECT expired.id, expired.variant_id, expired.price, expired.currency, expired.recorded_at
+        FROM {partition_name} AS expired
+        JOIN product_variants AS pv ON pv.current_price_record_id = expired.id
+    """)).rowcount
+    if PRICE_HISTORY_ARCHIVE_MODE == "drop":
+        connection.execute(text(f"DROP TABLE {partition_name}"))
+    else:
+        connection.execute(text(f"CREATE SCHEMA IF NOT EXISTS {PRICE_HISTORY_ARCHIVE_SCHEMA}"))
+        connection.execute(text(f"ALTER TABLE {partition_name} SET SCHEMA {PRICE_HISTORY_ARCHIVE_SCHEMA}"))
+    print(
+        f"[Price History] Archived partition '{partition_name}' ({PRICE_HISTORY_ARCHIVE_MODE}), "
+        f"keeping {kept_records} current price records."
+    )
+
+def archive_expired_price_history(connection: Connection) -> int:
+    """Archives every monthly partition that ends before the retention window. Returns how many were archived."""
+    if PRICE_HISTORY_RETENTION_MONTHS <= 0:
+        return 0
+    current_month = datetime.now(timezone.utc).date().replace(day=1)
+    retention_start = add_months(current_month, -PRICE_HISTORY_RETENTION_MONTHS)
+    expired_partitions = [
+        (partition_name, month) for partition_name, month in get_monthly_partitions(connection)
+        if add_months(month, 1) <= retention_start
+    ]
+    for partition_name, month in expired_partitions:
+        archive_price_history_partition(connection, partition_name, month)
+    return len(expired_partitions)
+
+def run_price_history_maintenance(engine: Engine, archive: bool = True) -> None:
+    """
+    Creates the upcoming partitions and, unless `archive` is False, archives the expired ones.
+    Skipped if another worker is running it.
+    """
+    with engine.begin() as connection:
+        if not is_price_history_partitioned(connection):
+            return
+        if not connection.execute(
+            text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": PARTITION_MAINTENANCE_LOCK_KEY}
+        ).scalar():
+            return
+        ensure_price_history_partitions(connection)
+        if archive:
+            archive_expired_price_history(connection)
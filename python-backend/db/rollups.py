@@ -0,0 +1,67 @@
+from datetime import datetime
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+# Daily and weekly min/max/last price aggregates per variant, in the price_history_rollups table.
+# They are maintained incrementally whenever price records are inserted, so price charts read
+# a bounded number of buckets instead of a variant's whole price history.
+
+# resolution name -> the date_trunc field of its buckets
+PRICE_ROLLUP_RESOLUTIONS = {"daily": "day", "weekly": "week"}
+# number of most recent buckets a price history series returns per variant
+PRICE_HISTORY_SERIES_POINTS = {"daily": 90, "weekly": 104}
+
+# buckets follow UTC calendar days, as the charts key their days by ISO date.
+# Within a bucket min/max merge directly and the latest record decides the last price, so rolling up
+# the same record twice or records out of order still leaves the correct aggregate.
+PRICE_ROLLUP_UPSERT_SQL = """
+    INSERT INTO price_history_rollups (
+        variant_id, resolution, bucket_start, min_price, max_price, last_price, currency, last_recorded_at
+    )
+    SELECT
+        ph.variant_id,
+        resolutions.resolution,
+        date_trunc(resolutions.date_field, ph.recorded_at AT TIME ZONE 'UTC')::date,
+        min(ph.price),
+        max(ph.price),
+        (array_agg(ph.price ORDER BY ph.recorded_at DESC, ph.id DESC))[1],
+        (array_agg(ph.currency ORDER BY ph.recorded_at DESC, ph.id DESC))[1],
+        max(ph.recorded_at)
+    FROM price_history AS ph
+    CROSS JOIN (VALUES {resolution_values}) AS resolutions (resolution, date_field)
+    {where_clause}
+    GROUP BY ph.variant_id, resolutions.resolution, 3
+    ON CONFLICT (variant_id, resolution, bucket_start) DO UPDATE SET
+        min_price = least(price_history_rollups.min_price, excluded.min_price),
+        max_price = greatest(price_history_rollups.max_price, excluded.max_price),
+        last_price = CASE WHEN excluded.last_recorded_at >= price_history_rollups.last_recorded_at
+            THEN excluded.last_price ELSE price_history_rollups.last_price END,
+        currency = CASE WHEN excluded.last_recorded_at >= price_history_rollups.last_recorded_at
+            THEN excluded.currency ELSE price_history_rollups.currency END,
+        last_recorded_at = greatest(price_history_rollups.last_recorded_at, excluded.last_recorded_at)
+"""
+
+def build_price_rollup_upsert(where_clause: str = ""):
+    """Builds the statement that folds the selected price records into every resolution's buckets."""
+    resolution_values = ", ".join(
+        f"('{resolution}', '{date_field}')" for resolution, date_field in PRICE_ROLLUP_RESOLUTIONS.items()
+    )
+    return text(PRICE_ROLLUP_UPSERT_SQL.format(resolution_values=resolution_values, where_clause=where_clause))
+
+def rollup_price_records(session: Session, price_record_ids: list[int], recorded_since: datetime) -> None:
+    """
+    Adds newly inserted price records to their rollup buckets, inside the caller's transaction.
+    `recorded_since` is the oldest recorded_at among them, which limits the lookup to the newest partitions.
+    """
+    if not price_record_ids:
+        return
+    session.execute(
+        build_price_rollup_upsert("WHERE ph.id = ANY(:price_record_ids) AND ph.recorded_at >= :recorded_since"),
+        {"price_record_ids": list(price_record_ids), "recorded_since": recorded_since},
+    )
+
+def backfill_price_rollups(connection: Connection) -> int:
+    """Rebuilds the rollups from the whole price history. Returns the number of buckets written."""
+    return connection.execute(build_price_rollup_upsert()).rowcount
@@ -0,0 +1,72 @@
+import re
+
+from sqlalchemy import Float, cast, literal_column, or_, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql import func
+
+from .models import Product
+
+# Bulgarian streamlined transliteration, applied to both the indexed text and the user's query,
+# so "самсунг" finds "Samsung" and "telefon" finds "Телефон"
+CYRILLIC_TO_LATIN = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ж": "zh", "з": "z",
+    "и": "i", "й": "y", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p",
+    "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "h", "ц": "ts", "ч": "ch",
+    "ш": "sh", "щ": "sht", "ъ": "a", "ь": "y", "ю": "yu", "я": "ya",
+    # Russian and Ukrainian letters that show up in product names
+    "ё": "yo", "ы": "y", "э": "e", "є": "ye", "і": "i", "ї": "yi",
+}
+SEARCH_TOKEN_PATTERN = re.compile(r"\w+")
+# the text search configuration of Product.search_vector, inlined so the query also renders as literal SQL
+SEARCH_TEXT_CONFIG = literal_column("'simple'::regconfig")
+
+# set by detect_trigram_search once the pg_trgm extension is known to be installed
+trigram_search_enabled = False
+
+def normalize_search_text(value: str) -> str:
+    """Lowercases and transliterates text to Latin, the form both the search index and queries are compared in."""
+    return "".join(CYRILLIC_TO_LATIN.get(char, char) for char in value.lower())
+
+def build_product_search_text(name: str, brand: str) -> str:
+    """Builds the value of Product.search_text, from which the search vector and trigram index are built."""
+    return normalize_search_text(f"{name} {brand}")
+
+def build_search_tsquery(normalized_query: str):
+    """Builds a prefix tsquery that requires every word of the query, so results narrow down while the user types."""
+    tokens = SEARCH_TOKEN_PATTERN.findall(normalized_query)
+    if not tokens:
+        return None
+    return func.to_tsquery(SEARCH_TEXT_CONFIG, " & ".join(f"{token}:*" for token in tokens))
+
+def build_search_clauses(query: str):
+    """
+    Returns the filter and the relevance expression for a text query.
+    Full-text matches rank by ts_rank_cd. With pg_trgm, a substring or close-enough word
+    (word similarity) also matches, which tolerates typos and ranks by how close the words are.
+    """
+    normalized_query = normalize_search_text(query.strip())
+    ts_query = build_search_tsquery(normalized_query)
+
+    conditions = []
+    rank = cast(0, Float)
+    if ts_query is not None:
+        conditions.append(Product.search_vector.op("@@")(ts_query))
+        rank = rank + func.ts_rank_cd(Product.search_vector, ts_query)
+    if trigram_search_enabled:
+        # both are served by the trigram GIN index, so they do not fall back to a sequential scan
+        conditions.append(Product.search_text.ilike(f"%{normalized_query}%"))
+        conditions.append(Product.search_text.op("%>")(normalized_query))
+        rank = rank + func.word_similarity(normalized_query, Product.search_text)
+    if not conditions:
+        conditions.append(Product.search_text.ilike(f"%{normalized_query}%"))
+    return or_(*conditions), cast(rank, Float)
+
+def detect_trigram_search(engine: Engine) -> None:
+    """Enables the trigram matching clauses if the pg_trgm extension is installed (see migration 2)."""
+    global trigram_search_enabled
+    with engine.connect() as connection:
+        trigram_search_enabled = connection.execute(
+            text("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+        ).scalar()
+    if not trigram_search_enabled:
+        print("[Search] pg_trgm is not installed, product search runs without typo tolerance.")
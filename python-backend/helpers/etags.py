@@ -0,0 +1,27 @@
+import hashlib
+
+from fastapi import Response
+
+def compute_etag(*parts: any) -> str:
+    """Builds a strong ETag from the values that identify a version of a response."""
+    fingerprint = "|".join("" if part is None else str(part) for part in parts)
+    return f'"{hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:32]}"'
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Checks an If-None-Match header, which may list several ETags or be '*'."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison, so a W/ prefix does not prevent a match
+    candidate_etags = {candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")}
+    return etag in candidate_etags
+
+def not_modified_response(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+def with_etag(response: Response, etag: str) -> Response:
+    """Tags a response, asking clients to revalidate it before every reuse."""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return response
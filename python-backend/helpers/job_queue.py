@@ -0,0 +1,102 @@
+import asyncio
+import heapq
+import itertools
+import os
+from typing import Awaitable, Callable
+
+from dotenv import load_dotenv
+load_dotenv()
+
+JOB_WORKER_COUNT = int(os.getenv("JOB_WORKER_COUNT", "2"))
+JOB_QUEUE_MAX_DEPTH = int(os.getenv("JOB_QUEUE_MAX_DEPTH", "20"))
+
+JobFactory = Callable[[], Awaitable[None]]
+PositionCallback = Callable[[str, int], Awaitable[None]]
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is already at its maximum depth."""
+
+class JobQueue:
+    """
+    A bounded priority queue served by a fixed pool of asyncio workers.
+
+    Jobs with a higher priority run first; jobs with the same priority run in submission order.
+    Every time the queue changes, `on_position_change` is called with the new 1-based
+    position of each waiting job whose position changed.
+    """
+
+    def __init__(
+        self,
+        worker_count: int = JOB_WORKER_COUNT,
+        max_depth: int = JOB_QUEUE_MAX_DEPTH,
+        on_position_change: PositionCallback | None = None,
+    ):
+        self.worker_count = worker_count
+        self.max_depth = max_depth
+        self.on_position_change = on_position_change
+        # heap of (-priority, sequence, job_id, job_factory)
+        self._pending: list[tuple[int, int, str, JobFactory]] = []
+        self._sequence = itertools.count()
+        self._available = asyncio.Semaphore(0)
+        # serializes position updates so a job never starts while its queued status is still being written
+        self._position_lock = asyncio.Lock()
+        # job_id -> the last position reported for it
+        self._reported_positions: dict[str, int] = {}
+        self._workers: list[asyncio.Task] = []
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def is_full(self) -> bool:
+        return len(self._pending) >= self.max_depth
+
+    async def submit(self, job_id: str, job_factory: JobFactory, priority: int = 0) -> None:
+        """Queues a job, raising QueueFullError if the queue is at its maximum depth."""
+        if self.is_full():
+            raise QueueFullError(f"Job queue is full ({self.max_depth} jobs waiting).")
+
+        heapq.heappush(self._pending, (-priority, next(self._sequence), job_id, job_factory))
+        self._available.release()
+        await self._notify_positions()
+
+    def start(self):
+        for worker_number in range(self.worker_count):
+            self._workers.append(asyncio.create_task(self._worker(worker_number)))
+        print(f"[Job Queue] Started {self.worker_count} workers (max queue depth: {self.max_depth}).")
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+    async def _notify_positions(self):
+        if self.on_position_change is None:
+            return
+        async with self._position_lock:
+            positions = {job_id: position for position, (_, _, job_id, _) in enumerate(sorted(self._pending), start=1)}
+            # jobs that left the queue are not reported again
+            self._reported_positions = {
+                job_id: position for job_id, position in self._reported_positions.items() if job_id in positions
+            }
+            for job_id, position in positions.items():
+                if self._reported_positions.get(job_id) == position:
+                    continue
+                try:
+                    await self.on_position_change(job_id, position)
+                    self._reported_positions[job_id] = position
+                except Exception as e:
+                    print(f"[Job Queue] Failed to report queue position for job {job_id}: {e}")
+
+    async def _worker(self, worker_number: int):
+        while True:
+            await self._available.acquire()
+            _, _, job_id, job_factory = heapq.heappop(self._pending)
+            await self._notify_positions()
+
+            print(f"[Job Queue] Worker {worker_number} started job {job_id} ({len(self._pending)} waiting).")
+            try:
+                await job_factory()
+            except Exception as e:
+                print(f"[Job Queue] Job {job_id} failed: {e}")
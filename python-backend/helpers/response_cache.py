@@ -0,0 +1,116 @@
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+load_dotenv()
+
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")
+RESPONSE_CACHE_REDIS_URL = os.getenv("RESPONSE_CACHE_REDIS_URL", "redis://localhost:6379/0")
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "300"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000"))
+
+# cache keys of the catalog endpoints, shared by the endpoints that fill them and the CRUD writes that clear them
+LATEST_PRODUCTS_KEY = "latest-products"
+CATEGORIES_KEY = "categories"
+
+def product_cache_key(slug: str) -> str:
+    return f"product:{slug}"
+
+class ResponseCache(ABC):
+    """Cache of serialized JSON response bodies for the hot catalog endpoints."""
+
+    @abstractmethod
+    def get(self, key: str) -> bytes | None:
+        """Returns the cached body, or None on a miss or after expiry."""
+
+    @abstractmethod
+    def set(self, key: str, body: bytes, ttl_seconds: int | None = None) -> None:
+        """Caches a response body."""
+
+    @abstractmethod
+    def invalidate(self, *keys: str) -> None:
+        """Drops the given keys, so the next request reads fresh data from the database."""
+
+class InMemoryResponseCache(ResponseCache):
+    """Process-local LRU cache with a TTL per entry."""
+
+    def __init__(self, ttl_seconds: int = RESPONSE_CACHE_TTL_SECONDS, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # key -> (expires_at, body), ordered from least to most recently used
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, body = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return body
+
+    def set(self, key: str, body: bytes, ttl_seconds: int | None = None) -> None:
+        expires_at = time.monotonic() + (ttl_seconds if ttl_seconds is not None else self.ttl_seconds)
+        with self._lock:
+            self._entries[key] = (expires_at, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *keys: str) -> None:
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+class RedisResponseCache(ResponseCache):
+    """
+    Cache shared by every worker and node, so an invalidation from the scraping
+    pipeline is seen by all of them. Requires the optional `redis` package.
+    """
+
+    def __init__(self, url: str = RESPONSE_CACHE_REDIS_URL, ttl_seconds: int = RESPONSE_CACHE_TTL_SECONDS):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("RESPONSE_CACHE_BACKEND=redis requires the 'redis' package: pip install redis") from e
+        self.client = redis.Redis.from_url(url)
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, key: str) -> bytes | None:
+        try:
+            return self.client.get(f"response-cache:{key}")
+        except Exception as e:
+            # a cache outage must not take the API down, so fall back to the database
+            print(f"[Response Cache] Redis read failed for '{key}': {e}")
+            return None
+
+    def set(self, key: str, body: bytes, ttl_seconds: int | None = None) -> None:
+        try:
+            self.client.set(f"response-cache:{key}", body, ex=ttl_seconds if ttl_seconds is not None else self.ttl_seconds)
+        except Exception as e:
+            print(f"[Response Cache] Redis write failed for '{key}': {e}")
+
+    def invalidate(self, *keys: str) -> None:
+        if not keys:
+            return
+        try:
+            self.client.delete(*(f"response-cache:{key}" for key in keys))
+        except Exception as e:
+            print(f"[Response Cache] Redis invalidation failed for {keys}: {e}")
+
+def create_response_cache() -> ResponseCache:
+    """Builds the response cache selected by the RESPONSE_CACHE_BACKEND environment variable ("memory" or "redis")."""
+    if RESPONSE_CACHE_BACKEND == "memory":
+        return InMemoryResponseCache()
+    if RESPONSE_CACHE_BACKEND == "redis":
+        return RedisResponseCache()
+    raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND: '{RESPONSE_CACHE_BACKEND}'. Use 'memory' or 'redis'.")
+
+response_cache = create_response_cache()
@@ -1,6 +1,7 @@
 import json
 import re
 import os
+import hashlib
 from typing import Literal
 
 def parse_price(price_str: str) -> float:
@@ -19,6 +20,15 @@ def parse_price(price_str: str) -> float:
     except ValueError:
         return 0.0
     
+def compute_content_hash(markdown: str) -> str:
+    """
+    Hashes page markdown after normalizing its whitespace, so re-rendered but otherwise
+    identical pages get the same hash.
+    """
+    lines = (" ".join(line.split()) for line in markdown.splitlines())
+    normalized = "\n".join(line for line in lines if line)
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
 def extract_dynamic_data_from_markdown(markdown: str, exlude_price=False, exclude_availability=False) -> tuple[float | None, Literal['Неясен', 'В наличност', 'Изчерпан'] | None]:
     """
     Reads markdown and extracts the product price and availability status.
@@ -31,7 +41,7 @@ def extract_dynamic_data_from_markdown(markdown: str, exlude_price=False, exclud
 
     Returns:
         A tuple containing:
-        - A product price, converted to float, or None if excluded.
+        - A product price, converted to float, or None if excluded or not found.
         - The availability status string or None if excluded.
     """
     extracted_price: float | None = None
@@ -62,7 +72,8 @@ def extract_dynamic_data_from_markdown(markdown: str, exlude_price=False, exclud
         re.IGNORECASE | re.VERBOSE | re.MULTILINE
     )
         matches = price_pattern.findall(markdown)
-        extracted_price = [parse_price(match) for match in matches][0]
+        if matches:
+            extracted_price = parse_price(matches[0])
 
     if not exclude_availability:
         negative_lookbehind = r'(?<!вече\s)' 
@@ -0,0 +1,67 @@
+from fastapi import Response
+from pydantic import TypeAdapter
+
+from configs.pydantic_models import (
+    ProductSchema,
+    ProductCardSchema,
+    ProductListingPageSchema,
+    ProductDetailSchema,
+    ComparisonVariantSchema,
+    FacetValueSchema,
+    PriceHistorySeriesSchema,
+)
+from db.models import Product as ProductModel
+from helpers.utils import calculate_matching_variants
+from helpers.response_cache import response_cache
+
+# adapters are built once at import time, so every request reuses the compiled validators and serializers
+product_list_adapter = TypeAdapter(list[ProductSchema])
+product_card_list_adapter = TypeAdapter(list[ProductCardSchema])
+product_listing_page_adapter = TypeAdapter(ProductListingPageSchema)
+product_detail_adapter = TypeAdapter(ProductDetailSchema)
+comparison_list_adapter = TypeAdapter(list[ComparisonVariantSchema])
+category_list_adapter = TypeAdapter(list[dict[str, str]])
+category_facets_adapter = TypeAdapter(dict[str, list[FacetValueSchema]])
+price_history_series_adapter = TypeAdapter(PriceHistorySeriesSchema)
+
+def serialize_task_products(products: list[ProductModel], user_filters: dict[str, str] | None = None) -> list[dict[str, any]]:
+    """
+    Validates a batch of ORM products in one call and returns JSON-ready dicts,
+    annotated with the variants matching the user's filters.
+    """
+    product_schemas = product_list_adapter.validate_python(products, from_attributes=True)
+    if user_filters:
+        for product_schema, product_model in zip(product_schemas, products):
+            count, urls = calculate_matching_variants(product_model, user_filters)
+            product_schema.CRAWLEEBOT_matchingVariantCount = count
+            product_schema.CRAWLEEBOT_matchingVariantUrls = urls
+
+    return product_list_adapter.dump_python(product_schemas, mode="json")
+
+def json_response(
+    adapter: TypeAdapter, data: any, cache_key: str | None = None, cache_version: str = ""
+) -> Response:
+    """
+    Validates ORM data with a prebuilt adapter and returns it as raw JSON bytes.
+    If a cache key is given, the body is also stored in the response cache, tagged with
+    cache_version: the ETag or fingerprint of the data as it was before reading it.
+    """
+    validated_data = adapter.validate_python(data, from_attributes=True)
+    body = adapter.dump_json(validated_data)
+    if cache_key is not None:
+        response_cache.set(cache_key, cache_version.encode("utf-8") + b"\n" + body)
+    return Response(content=body, media_type="application/json")
+
+def cached_json_response(cache_key: str, cache_version: str = "") -> Response | None:
+    """
+    Returns the cached response body for a key, or None on a cache miss.
+    A body cached at another version is a miss too: it may have been stored after the write that
+    invalidated it, or by a worker whose own cache that write never cleared.
+    """
+    cached_entry = response_cache.get(cache_key)
+    if cached_entry is None:
+        return None
+    version, _, body = cached_entry.partition(b"\n")
+    if version != cache_version.encode("utf-8"):
+        return None
+    return Response(content=body, media_type="application/json")
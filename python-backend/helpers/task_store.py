@@ -0,0 +1,346 @@
+import itertools
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import TypedDict
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from sqlalchemy import create_engine, delete, select, or_
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+
+from db.models import AnalysisTask, AnalysisTaskProducts, AnalysisTaskVersion, AnalysisRequest
+
+TASK_STORE_BACKEND = os.getenv("TASK_STORE_BACKEND", "memory")
+TASK_STORE_URL = os.getenv("TASK_STORE_URL")
+TASK_TTL_SECONDS = int(os.getenv("TASK_TTL_SECONDS", "3600"))
+TASK_RESULT_TTL_SECONDS = int(os.getenv("TASK_RESULT_TTL_SECONDS", "300"))
+TASK_STORE_MAX_ENTRIES = int(os.getenv("TASK_STORE_MAX_ENTRIES", "1000"))
+# name of the counter row in analysis_task_versions
+TASK_VERSION_COUNTER = "tasks"
+ANALYSIS_COALESCE_WINDOW_SECONDS = int(os.getenv("ANALYSIS_COALESCE_WINDOW_SECONDS", "120"))
+# how often a socket re-reads a shared store, in case its task runs in another worker
+TASK_STORE_SYNC_INTERVAL_SECONDS = float(os.getenv("TASK_STORE_SYNC_INTERVAL_SECONDS", "30"))
+
+class TaskRecord(TypedDict):
+    version: int
+    state: dict[str, any]
+
+class TaskProducts(TypedDict):
+    seq: int
+    data: list[dict[str, any]]
+
+class TaskStore(ABC):
+    """
+    Storage for the state of running analysis tasks.
+
+    Every write gives the record a new version from a store-wide counter, which lets a socket served
+    by one worker notice updates written by another worker sharing the same backend. Versions never
+    restart, not even for a task written again after it expired or was evicted.
+
+    The product snapshot of a task is kept apart from its status, so the status updates sent many
+    times during a run do not copy the products along. Only the run of a task writes its products.
+    """
+    # whether other workers can write the same tasks, which only a re-read of the store reveals
+    shared_between_workers = False
+
+    @abstractmethod
+    def get(self, task_id: str) -> TaskRecord | None:
+        """
+        Returns the current record for a task, or None if it is unknown or expired.
+        Its state holds the stored products under `seq` and `data`.
+        """
+
+    @abstractmethod
+    def set(
+        self,
+        task_id: str,
+        state: dict[str, any],
+        ttl_seconds: int | None = None,
+        products: TaskProducts | None = None,
+    ) -> TaskRecord:
+        """
+        Stores the new status of a task and returns the record with its new version.
+        The products are replaced only when given; otherwise the stored ones are kept, and the
+        returned record holds just the new status.
+        """
+
+    @abstractmethod
+    def delete(self, task_id: str) -> None:
+        """Removes a task from the store."""
+
+    @abstractmethod
+    def claim_request(self, request_key: str, task_id: str, ttl_seconds: int | None = None) -> str:
+        """
+        Atomically assigns a request key to a task, unless another task still holds it.
+        Returns the task_id now holding the key, so callers can attach to an in-flight task.
+        Claiming a key with the task that already holds it only refreshes its expiry.
+        """
+
+    @abstractmethod
+    def release_request(self, request_key: str) -> None:
+        """Frees a request key so the next identical request starts a new task."""
+
+    @abstractmethod
+    def purge_expired(self) -> int:
+        """Removes all expired tasks and request keys and returns how many were removed."""
+
+class InMemoryTaskStore(TaskStore):
+    """Process-local task store with a TTL per entry and LRU eviction above `max_entries`."""
+
+    def __init__(self, ttl_seconds: int = TASK_TTL_SECONDS, max_entries: int = TASK_STORE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # task_id -> (expires_at, record), ordered from least to most recently used
+        self._entries: OrderedDict[str, tuple[float, TaskRecord]] = OrderedDict()
+        self._products: dict[str, TaskProducts] = {}
+        # request_key -> (expires_at, task_id)
+        self._requests: dict[str, tuple[float, str]] = {}
+        self._versions = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def get(self, task_id: str) -> TaskRecord | None:
+        with self._lock:
+            entry = self._entries.get(task_id)
+            if entry is None:
+                return None
+            expires_at, record = entry
+            if expires_at <= time.monotonic():
+                self._remove(task_id)
+                return None
+            self._entries.move_to_end(task_id)
+            products = self._products.get(task_id)
+            if products is None:
+                return record
+            return {"version": record["version"], "state": {**record["state"], **products}}
+
+    def set(
+        self,
+        task_id: str,
+        state: dict[str, any],
+        ttl_seconds: int | None = None,
+        products: TaskProducts | None = None,
+    ) -> TaskRecord:
+        expires_at = time.monotonic() + (ttl_seconds if ttl_seconds is not None else self.ttl_seconds)
+        with self._lock:
+            record: TaskRecord = {"version": next(self._versions), "state": state}
+            self._entries[task_id] = (expires_at, record)
+            self._entries.move_to_end(task_id)
+            if products is not None:
+                self._products[task_id] = products
+
+            while len(self._entries) > self.max_entries:
+                evicted_task_id = next(iter(self._entries))
+                self._remove(evicted_task_id)
+                print(f"[Task Store] Evicted least recently used task {evicted_task_id}")
+
+        if products is None:
+            return record
+        return {"version": record["version"], "state": {**state, **products}}
+
+    def _remove(self, task_id: str) -> None:
+        self._entries.pop(task_id, None)
+        self._products.pop(task_id, None)
+
+    def delete(self, task_id: str) -> None:
+        with self._lock:
+            self._remove(task_id)
+
+    def claim_request(self, request_key: str, task_id: str, ttl_seconds: int | None = None) -> str:
+        now = time.monotonic()
+        with self._lock:
+            claim = self._requests.get(request_key)
+            if claim is not None and claim[0] > now and claim[1] != task_id:
+                return claim[1]
+            self._requests[request_key] = (now + (ttl_seconds if ttl_seconds is not None else self.ttl_seconds), task_id)
+            return task_id
+
+    def release_request(self, request_key: str) -> None:
+        with self._lock:
+            self._requests.pop(request_key, None)
+
+    def purge_expired(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            expired = [task_id for task_id, (expires_at, _) in self._entries.items() if expires_at <= now]
+            for task_id in expired:
+                self._remove(task_id)
+            expired_requests = [key for key, (expires_at, _) in self._requests.items() if expires_at <= now]
+            for request_key in expired_requests:
+                del self._requests[request_key]
+        return len(expired) + len(expired_requests)
+
+class DatabaseTaskStore(TaskStore):
+    """
+    Task store backed by the `analysis_tasks` table (Postgres or SQLite), shared by
+    every worker that points at the same database. The products live in `analysis_task_products`,
+    whose row is only written when they change.
+    """
+    shared_between_workers = True
+
+    def __init__(self, engine: Engine, ttl_seconds: int = TASK_TTL_SECONDS):
+        self.engine = engine
+        self.ttl_seconds = ttl_seconds
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def _insert(self, model: type[AnalysisTask | AnalysisTaskProducts | AnalysisTaskVersion | AnalysisRequest]):
+        if self.engine.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        elif self.engine.dialect.name == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            raise ValueError(f"Unsupported task store database: {self.engine.dialect.name}")
+        return insert(model)
+
+    def get(self, task_id: str) -> TaskRecord | None:
+        stmt = (
+            select(AnalysisTask.version, AnalysisTask.state, AnalysisTaskProducts.seq, AnalysisTaskProducts.data)
+            .outerjoin(AnalysisTaskProducts, AnalysisTaskProducts.task_id == AnalysisTask.task_id)
+            .where(AnalysisTask.task_id == task_id)
+            .where(AnalysisTask.expires_at > datetime.now(timezone.utc))
+        )
+        with self.SessionLocal() as session:
+            row = session.execute(stmt).first()
+        if row is None:
+            return None
+        if row.seq is None:
+            return {"version": row.version, "state": row.state}
+        return {"version": row.version, "state": {**row.state, "seq": row.seq, "data": row.data}}
+
+    def _next_version_stmt(self):
+        stmt = self._insert(AnalysisTaskVersion).values(name=TASK_VERSION_COUNTER, value=1)
+        return stmt.on_conflict_do_update(
+            index_elements=[AnalysisTaskVersion.name],
+            set_={"value": AnalysisTaskVersion.value + 1},
+        ).returning(AnalysisTaskVersion.value)
+
+    def set(
+        self,
+        task_id: str,
+        state: dict[str, any],
+        ttl_seconds: int | None = None,
+        products: TaskProducts | None = None,
+    ) -> TaskRecord:
+        now = datetime.now(timezone.utc)
+        expires_at = now + timedelta(seconds=ttl_seconds if ttl_seconds is not None else self.ttl_seconds)
+
+        with self.SessionLocal() as session:
+            # the counter row stays locked until the commit, so versions also commit in increasing order
+            version = session.execute(self._next_version_stmt()).scalar_one()
+            stmt = self._insert(AnalysisTask).values(
+                task_id=task_id, state=state, version=version, updated_at=now, expires_at=expires_at
+            )
+            session.execute(stmt.on_conflict_do_update(
+                index_elements=[AnalysisTask.task_id],
+                set_={
+                    "state": stmt.excluded.state,
+                    "version": stmt.excluded.version,
+                    "updated_at": stmt.excluded.updated_at,
+                    "expires_at": stmt.excluded.expires_at,
+                },
+            ))
+            if products is not None:
+                products_stmt = self._insert(AnalysisTaskProducts).values(
+                    task_id=task_id, seq=products["seq"], data=products["data"]
+                )
+                session.execute(products_stmt.on_conflict_do_update(
+                    index_elements=[AnalysisTaskProducts.task_id],
+                    set_={"seq": products_stmt.excluded.seq, "data": products_stmt.excluded.data},
+                ))
+            session.commit()
+
+        if products is None:
+            return {"version": version, "state": state}
+        return {"version": version, "state": {**state, **products}}
+
+    def delete(self, task_id: str) -> None:
+        with self.SessionLocal() as session:
+            session.execute(delete(AnalysisTask).where(AnalysisTask.task_id == task_id))
+            session.execute(delete(AnalysisTaskProducts).where(AnalysisTaskProducts.task_id == task_id))
+            session.commit()
+
+    def claim_request(self, request_key: str, task_id: str, ttl_seconds: int | None = None) -> str:
+        now = datetime.now(timezone.utc)
+        expires_at = now + timedelta(seconds=ttl_seconds if ttl_seconds is not None else self.ttl_seconds)
+        stmt = self._insert(AnalysisRequest).values(
+            request_key=request_key, task_id=task_id, expires_at=expires_at
+        )
+        # take the key over only if the previous claim expired or it is our own claim
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[AnalysisRequest.request_key],
+            set_={"task_id": stmt.excluded.task_id, "expires_at": stmt.excluded.expires_at},
+            where=or_(AnalysisRequest.expires_at <= now, AnalysisRequest.task_id == stmt.excluded.task_id),
+        ).returning(AnalysisRequest.task_id)
+
+        with self.SessionLocal() as session:
+            claimed_task_id = session.execute(stmt).scalar_one_or_none()
+            if claimed_task_id is None:
+                claimed_task_id = session.execute(
+                    select(AnalysisRequest.task_id).where(AnalysisRequest.request_key == request_key)
+                ).scalar_one()
+            session.commit()
+        return claimed_task_id
+
+    def release_request(self, request_key: str) -> None:
+        with self.SessionLocal() as session:
+            session.execute(delete(AnalysisRequest).where(AnalysisRequest.request_key == request_key))
+            session.commit()
+
+    def purge_expired(self) -> int:
+        now = datetime.now(timezone.utc)
+        with self.SessionLocal() as session:
+            tasks_result = session.execute(delete(AnalysisTask).where(AnalysisTask.expires_at <= now))
+            # products whose task expired, or was removed before they were written
+            session.execute(delete(AnalysisTaskProducts).where(
+                AnalysisTaskProducts.task_id.not_in(select(AnalysisTask.task_id))
+            ))
+            requests_result = session.execute(delete(AnalysisRequest).where(AnalysisRequest.expires_at <= now))
+            session.commit()
+        return tasks_result.rowcount + requests_result.rowcount
+
+def merge_task_products(
+    previous_state: dict[str, any], new_products: list[dict[str, any]]
+) -> tuple[list[dict[str, any]], list[dict[str, any]], int]:
+    """
+    Merges a product update into a task's stored snapshot, returning the merged products,
+    the added or changed ones and the new sequence number.
+    The sequence number only moves when the product snapshot changes.
+    """
+    products_by_id = {product['id']: product for product in previous_state.get('data') or []}
+    changed_products = [product for product in new_products if products_by_id.get(product['id']) != product]
+    for product in changed_products:
+        products_by_id[product['id']] = product
+    seq: int = previous_state.get('seq', 0)
+    if changed_products:
+        seq += 1
+    return list(products_by_id.values()), changed_products, seq
+
+def create_task_store() -> TaskStore:
+    """
+    Builds the task store selected by the TASK_STORE_BACKEND environment variable.
+
+    - "memory" (default): process-local, bounded by TASK_STORE_MAX_ENTRIES.
+    - "database": shared table on TASK_STORE_URL (e.g. sqlite:///tasks.db), or on the
+      main Postgres database when TASK_STORE_URL is not set.
+    """
+    if TASK_STORE_BACKEND == "memory":
+        return InMemoryTaskStore()
+    if TASK_STORE_BACKEND == "database":
+        if TASK_STORE_URL:
+            engine = create_engine(TASK_STORE_URL)
+            # a dedicated task database is not covered by initialize_database_on_first_run
+            AnalysisTask.__table__.create(bind=engine, checkfirst=True)
+            AnalysisTaskProducts.__table__.create(bind=engine, checkfirst=True)
+            AnalysisTaskVersion.__table__.create(bind=engine, checkfirst=True)
+            AnalysisRequest.__table__.create(bind=engine, checkfirst=True)
+        else:
+            from db.helpers import engine
+        return DatabaseTaskStore(engine)
+    raise ValueError(f"Unknown TASK_STORE_BACKEND: '{TASK_STORE_BACKEND}'. Use 'memory' or 'database'.")
+
+task_store = create_task_store()
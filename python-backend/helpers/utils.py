@@ -1,5 +1,8 @@
 import re
+import json
+import hashlib
 from db.models import Product as ProductModel
+from configs.pydantic_models import SearchPayload
 
 def clean_output(raw_content:str) -> str:
     """Cleans up Markdown code block fences."""
@@ -50,4 +53,47 @@ def calculate_matching_variants(product: ProductModel, user_filters: dict[str, s
             count += 1
             matching_urls.append(variant.source_url)
             
-    return count, matching_urls
\ No newline at end of file
+    return count, matching_urls
+
+def get_search_payload_key(payload: SearchPayload) -> str:
+    """
+    Builds a stable hash of a search payload, so identical searches map to the same key
+    regardless of letter case, extra whitespace or the order of the filters.
+    """
+    def normalize(text: str) -> str:
+        return " ".join(text.lower().split())
+
+    normalized_payload = {
+        "product_name": normalize(payload.product_name),
+        "product_category": normalize(payload.product_category),
+        "filters": sorted((normalize(f.name), normalize(f.value)) for f in payload.filters),
+    }
+    serialized_payload = json.dumps(normalized_payload, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(serialized_payload.encode("utf-8")).hexdigest()
+
+def parse_spec_filters(raw_filters: str | None) -> dict[str, list[str]]:
+    """
+    Parses the JSON spec filters of a listing request, e.g. '{"ram": ["8GB", "16GB"]}'.
+    A single value may be given as a plain string. Raises ValueError on any other shape.
+    """
+    if not raw_filters:
+        return {}
+    try:
+        parsed_filters = json.loads(raw_filters)
+    except json.JSONDecodeError as e:
+        raise ValueError("The 'filters' parameter must be a JSON object.") from e
+    if not isinstance(parsed_filters, dict):
+        raise ValueError("The 'filters' parameter must be a JSON object.")
+
+    spec_filters: dict[str, list[str]] = {}
+    for spec_name, values in parsed_filters.items():
+        if isinstance(values, (str, int, float)):
+            values = [values]
+        if not isinstance(values, list) or not all(isinstance(value, (str, int, float)) for value in values):
+            raise ValueError(f"The values of the '{spec_name}' filter must be a list of strings.")
+        spec_filters[spec_name] = [str(value) for value in values]
+    return spec_filters
+
+def get_spec_filters_key(spec_filters: dict[str, list[str]]) -> str:
+    """Serializes spec filters in a stable order, for ETags and cache keys."""
+    return json.dumps({name: sorted(values) for name, values in spec_filters.items()}, ensure_ascii=False, sort_keys=True)
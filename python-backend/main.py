@@ -1,35 +1,99 @@
 import asyncio
-from fastapi import Body, FastAPI, HTTPException, Depends, Query, WebSocket, WebSocketDisconnect,BackgroundTasks
+from fastapi import Body, FastAPI, HTTPException, Depends, Header, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.encoders import jsonable_encoder
 from urllib.parse import unquote
 
 from configs.status_manager import TaskStatus, SubStatus, STATUS_MESSAGES
  
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import uuid
-from typing import Optional
+from typing import Literal, Optional
 
 from contextlib import asynccontextmanager
-from db.crud import (
+from db.async_crud import (
     get_newest_products,
     get_product_by_slug,
     get_products_by_category,
     get_product_variants_for_comparison,
     get_all_categories,
     search_products,
+    get_product_fingerprint,
+    get_variants_fingerprint,
+    get_catalog_fingerprint,
+    get_category_facets,
+    get_price_history_series,
+    get_schema_by_product_category,
 )
-from db.helpers import get_db
-from helpers.utils import calculate_matching_variants
-from configs.pydantic_models import SearchPayload, ProductSchema
+from db.helpers import get_async_db, async_engine, engine
+from db.instrumentation import get_pool_report, get_query_latency_report
+from db.partitions import run_price_history_maintenance, PRICE_HISTORY_MAINTENANCE_INTERVAL_SECONDS
+from helpers.utils import get_search_payload_key, parse_spec_filters, get_spec_filters_key
+from helpers.serializers import (
+    serialize_task_products,
+    json_response,
+    cached_json_response,
+    product_card_list_adapter,
+    product_listing_page_adapter,
+    product_detail_adapter,
+    comparison_list_adapter,
+    category_list_adapter,
+    category_facets_adapter,
+    price_history_series_adapter,
+)
+from helpers.etags import compute_etag, etag_matches, not_modified_response, with_etag
+from helpers.response_cache import product_cache_key, LATEST_PRODUCTS_KEY, CATEGORIES_KEY
+from helpers.task_store import (
+    TaskProducts,
+    task_store,
+    merge_task_products,
+    TASK_RESULT_TTL_SECONDS,
+    ANALYSIS_COALESCE_WINDOW_SECONDS,
+    TASK_STORE_SYNC_INTERVAL_SECONDS,
+)
+from helpers.job_queue import JobQueue, QueueFullError
+from configs.pydantic_models import SearchPayload
 from scraper import scrape_sites  
 
+TASK_PURGE_INTERVAL_SECONDS = 60
+# websocket close code sent when the followed task is no longer in the task store
+TASK_GONE_CLOSE_CODE = 4404
+# job queue priorities, assigned by the server: analyses that skip the LLM schema generation finish sooner
+ANALYSIS_PRIORITY_DEFAULT = 0
+ANALYSIS_PRIORITY_KNOWN_SCHEMA = 1
+
+async def purge_expired_tasks():
+    """Periodically drops expired tasks, including ones no socket ever connected to."""
+    while True:
+        await asyncio.sleep(TASK_PURGE_INTERVAL_SECONDS)
+        try:
+            purged_count = await asyncio.to_thread(task_store.purge_expired)
+            if purged_count:
+                print(f"[Task Store] Purged {purged_count} expired tasks.")
+        except Exception as e:
+            print(f"[Task Store] Failed to purge expired tasks: {e}")
+
+async def maintain_price_history():
+    """Periodically creates the upcoming price history partitions and archives the expired ones."""
+    while True:
+        await asyncio.sleep(PRICE_HISTORY_MAINTENANCE_INTERVAL_SECONDS)
+        try:
+            await asyncio.to_thread(run_price_history_maintenance, engine)
+        except Exception as e:
+            print(f"[Price History] Partition maintenance failed: {e}")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     from db.helpers import initialize_database_on_first_run
     initialize_database_on_first_run()
+    purge_task = asyncio.create_task(purge_expired_tasks())
+    price_history_task = asyncio.create_task(maintain_price_history())
+    job_queue.start()
     yield 
+    await job_queue.stop()
+    purge_task.cancel()
+    price_history_task.cancel()
+    await async_engine.dispose()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -46,21 +110,69 @@ def read_root():
     return {"message": "Hello from FastAPI"}
 
 @app.get("/api/latest-products")
-def read_latest_products( session: Session = Depends(get_db)):
-    newest_products = get_newest_products(session)
+async def read_latest_products( session: AsyncSession = Depends(get_async_db)):
+    catalog_version = compute_etag("catalog", *await get_catalog_fingerprint(session))
+    cached_response = cached_json_response(LATEST_PRODUCTS_KEY, catalog_version)
+    if cached_response is not None:
+        return cached_response
+
+    newest_products = await get_newest_products(session)
     if newest_products is None:
         raise HTTPException(status_code=404, detail="Products not found")
-    return newest_products
+    return json_response(
+        product_card_list_adapter, newest_products, cache_key=LATEST_PRODUCTS_KEY, cache_version=catalog_version
+    )
 
 @app.get("/api/product/{slug}")
-def read_product(slug: str, session: Session = Depends(get_db)):
-    product = get_product_by_slug(session, slug)
+async def read_product(
+    slug: str,
+    if_none_match: str | None = Header(None),
+    session: AsyncSession = Depends(get_async_db),
+):
+    # the fingerprint is a single aggregate row, so a revalidation never loads the variants and their prices
+    fingerprint = await get_product_fingerprint(session, slug)
+    if fingerprint is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    etag = compute_etag("product", slug, *fingerprint)
+    if etag_matches(if_none_match, etag):
+        return not_modified_response(etag)
+
+    cached_response = cached_json_response(product_cache_key(slug), etag)
+    if cached_response is not None:
+        return with_etag(cached_response, etag)
+
+    product = await get_product_by_slug(session, slug)
     if product is None:
         raise HTTPException(status_code=404, detail="Product not found")
-    return product
+    return with_etag(
+        json_response(product_detail_adapter, product, cache_key=product_cache_key(slug), cache_version=etag), etag
+    )
+
+@app.get("/api/product/{slug}/price-history")
+async def read_product_price_history(
+    slug: str,
+    resolution: Literal["daily", "weekly"] = Query("daily"),
+    if_none_match: str | None = Header(None),
+    session: AsyncSession = Depends(get_async_db),
+):
+    fingerprint = await get_product_fingerprint(session, slug)
+    if fingerprint is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    etag = compute_etag("price-history", slug, resolution, *fingerprint)
+    if etag_matches(if_none_match, etag):
+        return not_modified_response(etag)
+
+    series = await get_price_history_series(session, slug, resolution)
+    return with_etag(
+        json_response(price_history_series_adapter, {"resolution": resolution, "variants": series}), etag
+    )
 
 @app.get("/api/compare-products")
-def get_comparison_data(ids_str: str = Query(..., alias="ids"), session: Session = Depends(get_db)):
+async def get_comparison_data(
+    ids_str: str = Query(..., alias="ids"),
+    if_none_match: str | None = Header(None),
+    session: AsyncSession = Depends(get_async_db),
+):
     if not ids_str:
         raise HTTPException(status_code=400, detail="Query parameter 'ids' cannot be empty.")
     try:
@@ -71,83 +183,161 @@ def get_comparison_data(ids_str: str = Query(..., alias="ids"), session: Session
             status_code=422,
             detail="Invalid format for 'ids' parameter. Please provide a comma-separated list of integers."
         )
-    variants_to_compare = get_product_variants_for_comparison(session, variant_ids)
+    found_count, *fingerprint = await get_variants_fingerprint(session, variant_ids)
+    if not found_count:
+        raise HTTPException(status_code=404, detail="None of the provided variant IDs could be found.")
+    etag = compute_etag("compare", *variant_ids, found_count, *fingerprint)
+    if etag_matches(if_none_match, etag):
+        return not_modified_response(etag)
+
+    variants_to_compare = await get_product_variants_for_comparison(session, variant_ids)
     if not variants_to_compare:
         raise HTTPException(status_code=404, detail="None of the provided variant IDs could be found.")
-    return variants_to_compare
+    return with_etag(json_response(comparison_list_adapter, variants_to_compare), etag)
 
 @app.post("/api/category-products")
-def read_category_products(
+async def read_category_products(
     category: str = Body(..., embed=True),
+    filters: dict[str, list[str]] = Body({}, embed=True),
     offset: int = Query(0),
     limit: int = Query(12),
     sort: str = Query("name-asc"),
-    session: Session = Depends(get_db),
+    cursor: str | None = Query(None),
+    if_none_match: str | None = Header(None),
+    session: AsyncSession = Depends(get_async_db),
 ):
     decoded_category = unquote(category)
-    result = search_products(
-        session,
-        category=decoded_category,
-        offset=offset,
-        limit=limit,
-        sort=sort,
+    fingerprint = await get_catalog_fingerprint(session)
+    etag = compute_etag(
+        "category", decoded_category, get_spec_filters_key(filters), offset, limit, sort, cursor, *fingerprint
     )
+    if etag_matches(if_none_match, etag):
+        return not_modified_response(etag)
+
+    try:
+        result = await search_products(
+            session,
+            category=decoded_category,
+            offset=offset,
+            limit=limit,
+            sort=sort,
+            cursor=cursor,
+            spec_filters=filters,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if not result:
          return {"data": [], "total": 0}
          
-    return result
+    return with_etag(json_response(product_listing_page_adapter, result), etag)
 
 
 @app.get("/api/search-products")
-def read_search_products(
+async def read_search_products(
     q: str | None = Query(None, alias="q"),
     offset: int = Query(0),
     limit: int = Query(12),
     sort: str = Query("name-asc"),
-    session: Session = Depends(get_db),
+    cursor: str | None = Query(None),
+    filters: str | None = Query(None, description='JSON spec filters, e.g. {"ram": ["8GB", "16GB"]}'),
+    if_none_match: str | None = Header(None),
+    session: AsyncSession = Depends(get_async_db),
 ):
-    result = search_products(
-        session,
-        query=q,
-        offset=offset,
-        limit=limit,
-        sort=sort,
-    )
+    try:
+        spec_filters = parse_spec_filters(filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    fingerprint = await get_catalog_fingerprint(session)
+    etag = compute_etag("search", q, get_spec_filters_key(spec_filters), offset, limit, sort, cursor, *fingerprint)
+    if etag_matches(if_none_match, etag):
+        return not_modified_response(etag)
+
+    try:
+        result = await search_products(
+            session,
+            query=q,
+            offset=offset,
+            limit=limit,
+            sort=sort,
+            cursor=cursor,
+            spec_filters=spec_filters,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if not result:
          return {"data": [], "total": 0}
 
-    return result
+    return with_etag(json_response(product_listing_page_adapter, result), etag)
+
+@app.post("/api/category-facets")
+async def read_category_facets(
+    category: str = Body(..., embed=True),
+    filters: dict[str, list[str]] = Body({}, embed=True),
+    if_none_match: str | None = Header(None),
+    session: AsyncSession = Depends(get_async_db),
+):
+    """Returns the spec values of a category with the number of products having each, narrowed by the given filters."""
+    decoded_category = unquote(category)
+    fingerprint = await get_catalog_fingerprint(session)
+    etag = compute_etag("facets", decoded_category, get_spec_filters_key(filters), *fingerprint)
+    if etag_matches(if_none_match, etag):
+        return not_modified_response(etag)
+
+    facets = await get_category_facets(session, decoded_category, spec_filters=filters)
+    return with_etag(json_response(category_facets_adapter, facets), etag)
 
 @app.get("/api/categories")
-def read_categories(session: Session = Depends(get_db)):
-    categories = get_all_categories(session)
+async def read_categories(session: AsyncSession = Depends(get_async_db)):
+    catalog_version = compute_etag("catalog", *await get_catalog_fingerprint(session))
+    cached_response = cached_json_response(CATEGORIES_KEY, catalog_version)
+    if cached_response is not None:
+        return cached_response
+
+    categories = await get_all_categories(session)
     if not categories:
         raise HTTPException(status_code=404, detail="Products categories not found")
 
-    return categories
+    return json_response(category_list_adapter, categories, cache_key=CATEGORIES_KEY, cache_version=catalog_version)
+
+@app.get("/api/db-stats")
+async def read_db_stats():
+    """Reports the connection pools' usage and the statement latencies per CRUD function since startup."""
+    return {
+        "pools": {"sync": get_pool_report(engine), "async": get_pool_report(async_engine.sync_engine)},
+        "queries": get_query_latency_report(),
+    }
 
 
 class ConnectionManager:
+    """
+    Keeps a per-task channel of subscriber queues. Every status update is published
+    once into each subscriber's queue, so sockets forward events as soon as they happen.
+    """
     def __init__(self):
-        self.active_connections: dict[str, WebSocket] = {}
+        self.subscribers: dict[str, set[asyncio.Queue]] = {}
 
-    async def connect(self, task_id: str, websocket: WebSocket):
+    async def connect(self, task_id: str, websocket: WebSocket) -> asyncio.Queue:
         await websocket.accept()
-        self.active_connections[task_id] = websocket
+        queue: asyncio.Queue = asyncio.Queue()
+        self.subscribers.setdefault(task_id, set()).add(queue)
         print(f"WebSocket connected for task {task_id}")
+        return queue
 
-    def disconnect(self, task_id: str):
-        if task_id in self.active_connections:
-            del self.active_connections[task_id]
+    def disconnect(self, task_id: str, queue: asyncio.Queue):
+        task_subscribers = self.subscribers.get(task_id)
+        if task_subscribers and queue in task_subscribers:
+            task_subscribers.discard(queue)
+            if not task_subscribers:
+                del self.subscribers[task_id]
             print(f"WebSocket disconnected for task {task_id}")
 
-    async def send_json_update(self, task_id: str, message: dict):
-        if task_id in self.active_connections:
-            await self.active_connections[task_id].send_json(message)
+    def publish(self, task_id: str, event: dict[str, any]):
+        for queue in self.subscribers.get(task_id, ()):
+            queue.put_nowait(event)
 
 manager = ConnectionManager()
 
-tasks = {}
+TERMINAL_STATUSES = {TaskStatus.COMPLETE.value, TaskStatus.ERROR.value}
 
 async def update_task_status(task_id: str, 
 status: TaskStatus, 
@@ -163,26 +353,73 @@ user_payload: Optional[SearchPayload] = None,
     
     payload = {"status": status.value, "message": message}
     if 'data' in kwargs:
-        raw_products: dict[str,any] = kwargs['data']
-        validated_products = []
-        for product_model in raw_products:
-            # create a Pydantic model from the SQLAlchemy object
-            product_schema = ProductSchema.model_validate(product_model)
-            if user_payload and user_payload.filters:
-                user_filters: dict[str, str] = {f.name: f.value for f in user_payload.filters}
-                count, urls = calculate_matching_variants(
-                    product_model, user_filters
-                )
-                product_schema.CRAWLEEBOT_matchingVariantCount = count
-                product_schema.CRAWLEEBOT_matchingVariantUrls = urls
-            
-            validated_products.append(product_schema)
-        
-        payload['data'] = jsonable_encoder(validated_products)
+        user_filters: dict[str, str] | None = None
+        if user_payload and user_payload.filters:
+            user_filters = {f.name: f.value for f in user_payload.filters}
+        new_products = serialize_task_products(kwargs['data'], user_filters)
         
-    tasks[task_id] = payload
+    # the store keeps the full product snapshot, so subscribers that attach later still get it;
+    # status-only updates leave it as it is. Only the task's own run sends products, one update
+    # at a time, so the snapshot read here cannot change before the merged one is written.
+    products = None
+    changed_products = None
+    if 'data' in kwargs:
+        previous_record = await asyncio.to_thread(task_store.get, task_id)
+        previous_state = previous_record["state"] if previous_record is not None else {}
+        merged_products, changed_products, seq = merge_task_products(previous_state, new_products)
+        if changed_products:
+            products = {"seq": seq, "data": merged_products}
+
+    await write_task_state(task_id, payload, changed_products, products)
+
+async def write_task_state(
+    task_id: str,
+    state: dict[str, any],
+    changed_products: list[dict[str, any]] | None = None,
+    products: TaskProducts | None = None,
+):
+    """Stores the status of a task, and its products if given, and publishes it to the task's subscribers."""
+    is_terminal = state["status"] in TERMINAL_STATUSES
+    # finished tasks only need to live long enough for late subscribers to read the result
+    ttl_seconds = TASK_RESULT_TTL_SECONDS if is_terminal else None
+    record = await asyncio.to_thread(task_store.set, task_id, state, ttl_seconds, products)
+    if is_terminal and products is None:
+        # the final status goes out with the whole product list
+        record = await asyncio.to_thread(task_store.get, task_id) or record
+    manager.publish(task_id, {**record, "changed_products": changed_products})
 
-async def run_crawleebot_task(task_id: str, payload: SearchPayload):
+def build_socket_message(event: dict[str, any], delta_mode: bool, is_snapshot: bool) -> dict[str, any]:
+    """
+    Shapes a task event for one subscriber.
+
+    - Full mode sends the whole product list whenever products change and with the final status.
+    - Delta mode sends a full snapshot first and afterwards only the added or changed products.
+      A client that sees a gap in `seq` can reconnect to receive a fresh snapshot.
+    """
+    state: dict[str, any] = event["state"]
+    message = {key: value for key, value in state.items() if key != 'data'}
+    changed_products = event.get("changed_products")
+
+    if delta_mode:
+        message["mode"] = "snapshot" if is_snapshot else "delta"
+        if is_snapshot and 'data' in state:
+            message['data'] = state['data']
+        elif not is_snapshot and changed_products:
+            message['data'] = changed_products
+        return message
+
+    if 'data' in state and (is_snapshot or changed_products or state["status"] in TERMINAL_STATUSES):
+        message['data'] = state['data']
+    return message
+
+async def report_queue_position(task_id: str, position: int):
+    # a job that is still waiting has no products yet, so its state is written without reading the stored one
+    message = STATUS_MESSAGES[(TaskStatus.QUEUED, SubStatus.WAITING_IN_QUEUE)].format(count=position)
+    await write_task_state(task_id, {"status": TaskStatus.QUEUED.value, "message": message})
+
+job_queue = JobQueue(on_position_change=report_queue_position)
+
+async def run_crawleebot_task(task_id: str, payload: SearchPayload, request_key: str):
     """The main orchestrator for the background task."""
     try:
         await scrape_sites(
@@ -191,12 +428,50 @@ async def run_crawleebot_task(task_id: str, payload: SearchPayload):
         )
     except Exception as e:
         print(f"FATAL ERROR in task {task_id}: {e}")
+        # failed results are not shared, the next identical request starts a new task
+        await asyncio.to_thread(task_store.release_request, request_key)
         await update_task_status(task_id, TaskStatus.ERROR, None)
+        return
+
+    # keep serving the finished result to identical requests for a short window
+    await asyncio.to_thread(task_store.claim_request, request_key, task_id, ANALYSIS_COALESCE_WINDOW_SECONDS)
+    record = await asyncio.to_thread(task_store.get, task_id)
+    if record is not None and record["state"].get("status") not in TERMINAL_STATUSES:
+        await update_task_status(task_id, TaskStatus.COMPLETE, SubStatus.SUCCESS)
+
+async def claim_or_attach(request_key: str, task_id: str) -> str:
+    """
+    Claims the request key for a new task, or returns the id of the in-flight task
+    already serving an identical request.
+    """
+    holder_task_id = await asyncio.to_thread(task_store.claim_request, request_key, task_id)
+    if holder_task_id == task_id:
+        return task_id
+    if await asyncio.to_thread(task_store.get, holder_task_id) is not None:
+        return holder_task_id
+
+    # the task holding the key no longer exists, so take the key over
+    await asyncio.to_thread(task_store.release_request, request_key)
+    return await asyncio.to_thread(task_store.claim_request, request_key, task_id)
+
+async def get_analysis_priority(session: AsyncSession, payload: SearchPayload) -> int:
+    """
+    Ranks an analysis by its expected cost, so short jobs are not stuck behind long ones.
+    A category with a stored extraction schema skips the schema generation run.
+    """
+    if await get_schema_by_product_category(session, payload.product_category) is not None:
+        return ANALYSIS_PRIORITY_KNOWN_SCHEMA
+    return ANALYSIS_PRIORITY_DEFAULT
+
+def raise_queue_full():
+    raise HTTPException(
+        status_code=429,
+        detail=STATUS_MESSAGES[(TaskStatus.ERROR, SubStatus.QUEUE_FULL)],
+        headers={"Retry-After": "30"},
+    )
 
 @app.post("/api/start-analysis")
-async def start_analysis(payload: SearchPayload, background_tasks: BackgroundTasks):
-    task_id = str(uuid.uuid4())
-    tasks[task_id] = {"status": "PENDING", "message": "Задачата е създадена..."}
+async def start_analysis(payload: SearchPayload, session: AsyncSession = Depends(get_async_db)):
     if not payload.product_name.strip():
         raise HTTPException(status_code=400, detail="Product name cannot be empty")
     if not payload.product_category.strip():
@@ -205,29 +480,82 @@ async def start_analysis(payload: SearchPayload, background_tasks: BackgroundTas
         raise HTTPException(status_code=400, detail="At least one product filter required")
     if len(payload.filters) > 10:
         raise HTTPException(status_code=400, detail="Too many filters provided")
-        
-    background_tasks.add_task(run_crawleebot_task, task_id, payload)
+
+    # a full queue turns the request away before its key is claimed, so no identical request attaches to it
+    if job_queue.is_full():
+        raise_queue_full()
+
+    task_id = str(uuid.uuid4())
+    await asyncio.to_thread(task_store.set, task_id, {"status": "PENDING", "message": "Задачата е създадена..."})
+
+    request_key = get_search_payload_key(payload)
+    attached_task_id = await claim_or_attach(request_key, task_id)
+    if attached_task_id != task_id:
+        print(f"Found an identical recent analysis. Attaching request to task {attached_task_id}")
+        await asyncio.to_thread(task_store.delete, task_id)
+        return {"task_id": attached_task_id}
+
+    priority = await get_analysis_priority(session, payload)
+    try:
+        await job_queue.submit(task_id, lambda: run_crawleebot_task(task_id, payload, request_key), priority=priority)
+    except QueueFullError:
+        # the queue filled up after the key was claimed; requests that attached meanwhile
+        # are following this task, so it ends with an error instead of disappearing
+        await asyncio.to_thread(task_store.release_request, request_key)
+        await update_task_status(task_id, TaskStatus.ERROR, SubStatus.QUEUE_FULL)
+        raise_queue_full()
 
     return {"task_id": task_id}
 
+
 @app.websocket("/ws/analysis/{task_id}")
-async def websocket_endpoint(websocket: WebSocket, task_id: str):
-    await manager.connect(task_id, websocket)
+async def websocket_endpoint(websocket: WebSocket, task_id: str, mode: str = Query("full")):
+    delta_mode = mode == "delta"
+    # events of tasks run by this worker always arrive through the queue; only a shared store
+    # can hold updates written by another worker, so only then is it re-read now and again
+    sync_interval = TASK_STORE_SYNC_INTERVAL_SECONDS if task_store.shared_between_workers else None
+    queue = await manager.connect(task_id, websocket)
     try:
-        while task_id in tasks and tasks[task_id].get("status") not in [TaskStatus.COMPLETE.value, TaskStatus.ERROR.value]:
-            # send the current status of the task
-            current_status = tasks.get(task_id, {})
-            await manager.send_json_update(task_id, current_status)
-            await asyncio.sleep(1) # Check for updates every second
+        # send the current status first, then forward every new event as it is published
+        record = await asyncio.to_thread(task_store.get, task_id)
+        if record is not None:
+            await websocket.send_json(build_socket_message(record, delta_mode, is_snapshot=True))
+            seq = record["state"].get("seq", 0)
+
+        while record is not None and record["state"].get("status") not in TERMINAL_STATUSES:
+            try:
+                next_record = await asyncio.wait_for(queue.get(), timeout=sync_interval)
+                is_snapshot = False
+            except asyncio.TimeoutError:
+                next_record = await asyncio.to_thread(task_store.get, task_id)
+                is_snapshot = True
+
+            if next_record is not None and next_record["version"] <= record["version"]:
+                if is_snapshot:
+                    continue
+                # an event older than the one already sent; the store tells whether anything was missed
+                next_record = await asyncio.to_thread(task_store.get, task_id)
+                if next_record is not None and next_record["version"] <= record["version"]:
+                    continue
+                is_snapshot = True
+
+            if next_record is None:
+                # the task expired or was evicted, so there is nothing left to follow
+                await websocket.close(code=TASK_GONE_CLOSE_CODE, reason="task no longer available")
+                return
 
-        if task_id in tasks:
-            await manager.send_json_update(task_id, tasks[task_id])
+            # status-only events carry no seq; a lower one means the task was written again from scratch,
+            # so delta clients need all of it
+            next_seq = next_record["state"].get("seq", seq)
+            is_snapshot = is_snapshot or next_seq < seq
+            seq = next_seq
+            record = next_record
+            await websocket.send_json(build_socket_message(record, delta_mode, is_snapshot))
 
     except WebSocketDisconnect:
-        manager.disconnect(task_id)
+        pass
     finally:
-        if task_id in tasks:
-            del tasks[task_id]
+        manager.disconnect(task_id, queue)
             
 if __name__ == "__main__":
     import uvicorn
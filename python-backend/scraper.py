@@ -2,7 +2,7 @@ import asyncio
 import json
 import time
 from typing import Optional, TypedDict
-from ollama import Client
+from ollama import AsyncClient
 
 from jsonschema import validate, ValidationError
 from crawl4ai import AsyncWebCrawler, CrawlerRunConfig, BrowserConfig, CacheMode
@@ -17,18 +17,20 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from helpers.scraper_helpers import (
+    compute_content_hash,
     extract_dynamic_data_from_markdown
 )
 from helpers.utils import clean_output
 from db.helpers import SessionLocal
 from db.crud import (
-    get_product_variant_by_url,
-    update_product_variant,
+    VariantRefreshData,
+    bulk_refresh_product_variants,
+    get_known_variant_content_hashes,
     read_products_from_db,
     create_product_category_schema,
     get_schema_by_product_category
 )
-from db.models import ProductCategorySchema
+from db.models import Product, ProductCategorySchema
 from data_aggregation import analyze_and_store_group, get_grouping_key
 from crawler import crawl_sites
 from configs.pydantic_models import SearchPayload
@@ -42,6 +44,7 @@ UpdateStatusCallable = Callable[
     Coroutine[None, None, None]
 ]
 
+# number of LLM extractions allowed to run against Ollama at the same time
 AGENT_CONCURRENCY = 4
 agent_semaphore = asyncio.Semaphore(AGENT_CONCURRENCY)
 
@@ -72,7 +75,8 @@ BASE_SCHEMA = {
     "required": ["name", "price", "brand", "currency", "category", "description", "specs"]
 }
 
-client = Client()
+# async, so a running generation never blocks the event loop (WebSocket updates, crawling, other extractions)
+client = AsyncClient()
 
 def truncate_markdown(content: str) -> str:
     """Truncate unnecessary markdown content."""
@@ -127,28 +131,20 @@ async def generate_schema_and_extract_data(session: Session, markdown_text: str,
     """
     messages = [{'role': 'system', 'content': system_prompt}, {'role': 'user', 'content': user_prompt}]
     
-    schema_json_text = ""
     async with agent_semaphore:
         try:
-            response_stream = client.chat(
+            response = await client.chat(
                 model="qwen3:4b", 
                 messages=messages, 
-                stream=True, 
                 think=True,  
                 options={'num_ctx': 10000, 'temperature': 0}
             )
-            for chunk in response_stream:
-                if chunk.message.thinking:
-                    print(chunk.message.thinking, end='', flush=True)
-                if chunk.message.content:
-                    print(chunk.message.content, end='', flush=True)
-                    schema_json_text += chunk.message.content
         except Exception as e:
             print(f"\nAn error occurred during schema generation: {e}")
             raise
 
-    print("\n  Generation and extraction complete. Processing response...")
-    response_data = json.loads(clean_output(schema_json_text))
+    print("  Generation and extraction complete. Processing response...")
+    response_data = json.loads(clean_output(response.message.content or ""))
     
     generated_schema_dict: dict[str, any] = response_data.get('generated_schema', {})
     extracted_data: dict[str, any] = response_data.get('extracted_data', {})
@@ -156,7 +152,7 @@ async def generate_schema_and_extract_data(session: Session, markdown_text: str,
     if not generated_schema_dict or not extracted_data:
         raise ValueError("LLM response was missing 'generated_schema' or 'extracted_data'.")
 
-    new_db_schema = create_product_category_schema(session, category, generated_schema_dict)
+    new_db_schema = await asyncio.to_thread(create_product_category_schema, session, category, generated_schema_dict)
     
     return {"schema": new_db_schema, "data": extracted_data}
 
@@ -184,25 +180,19 @@ async def extract_data_with_schema(markdown_text: str, schema: dict[str, any]) -
     """
     messages = [{'role': 'system', 'content': system_prompt}, {'role': 'user', 'content': user_prompt}]
 
-    data_json_text = ""
     async with agent_semaphore:
         try:
-            response_stream = client.chat(
+            response = await client.chat(
                 model="qwen3:4b", 
                 messages=messages, 
                 format="json", 
-                stream=True, 
                 options={'num_ctx': 10000, 'temperature': 0}
             )
-            for chunk in response_stream:
-                if chunk.message.content:
-                    print(chunk.message.content, end='', flush=True)
-                    data_json_text += chunk.message.content
         except Exception as e:
             print(f"\nAn error occurred during data extraction: {e}")
             return {}
             
-    return json.loads(clean_output(data_json_text))
+    return json.loads(clean_output(response.message.content or ""))
 
 async def process_single_crawled_and_scraped_result(result: CrawlResult, session: Session, schema_to_use: dict[str, any], is_called_from_schema_gen_mode_func = False, schema_gen_mode_parsed_data: dict[str, any] = None):
     """Orchestrates the full scraping workflow for a given page."""
@@ -214,18 +204,6 @@ async def process_single_crawled_and_scraped_result(result: CrawlResult, session
     print(f"\n--- Processing: {url} ---")
     markdown = truncate_markdown(result.markdown.raw_markdown)
     
-    existing_product_variant = await asyncio.to_thread(get_product_variant_by_url, session, url)
-    # if existing_product_variant:
-    #     print(f"  Product variant exists. Checking for fresh new data. LLM data extraction skipped.")
-    #     new_price, new_availability = extract_dynamic_data_from_markdown(markdown)
-    #     await asyncio.to_thread(
-    #         update_product_variant, 
-    #         session, 
-    #         existing_product_variant, 
-    #         new_price, 
-    #         new_availability
-    #     )
-    # else: 
     _, availability = extract_dynamic_data_from_markdown(markdown, exlude_price=True)
     parsed_data = None
     try:
@@ -248,6 +226,55 @@ async def process_single_crawled_and_scraped_result(result: CrawlResult, session
         print(f"   Error: {e}")
         return None
 
+# ----------------------------------------
+# LLM-FREE REFRESH OF KNOWN VARIANTS
+# ----------------------------------------
+def extract_refresh_data(result: CrawlResult, known_content_hash: str | None) -> VariantRefreshData | None:
+    """
+    Reads a known variant's price and availability straight from its crawled page, without the LLM.
+    A page whose content hash matches the last scrape is not extracted at all.
+    """
+    if not result.success:
+        print(f"\n- Failed to re-crawl: {result.url} | Reason: {result.error_message}")
+        return None
+
+    markdown = truncate_markdown(result.markdown.raw_markdown)
+    content_hash = compute_content_hash(markdown)
+    if content_hash == known_content_hash:
+        return {"source_url": result.url, "content_hash": content_hash, "price": None, "availability": None}
+
+    price, availability = extract_dynamic_data_from_markdown(markdown)
+    # parse_price falls back to 0 for unreadable amounts, which is never a real price
+    if price is not None and float(price) <= 0:
+        price = None
+    if price is None:
+        print(f"  No price found on {result.url}. Refreshing its availability only.")
+    return {"source_url": result.url, "content_hash": content_hash, "price": price, "availability": availability}
+
+async def refresh_known_variants(
+    content_hashes_by_url: dict[str, str | None], browser_config: BrowserConfig, config: CrawlerRunConfig, dispatcher: MemoryAdaptiveDispatcher
+) -> list[Product]:
+    """
+    Re-crawls stale variants that are already in the DB, keyed by URL with their last content hash,
+    and writes their new prices and availabilities in one batch. Returns the refreshed parent products.
+    """
+    refresh_data: list[VariantRefreshData] = []
+    async with AsyncWebCrawler(config=browser_config) as crawler:
+        async for result in await crawler.arun_many(urls=list(content_hashes_by_url), config=config, dispatcher=dispatcher):
+            result: CrawlResult
+            data = extract_refresh_data(result, content_hashes_by_url.get(result.url))
+            if data is not None:
+                refresh_data.append(data)
+
+    if not refresh_data:
+        return []
+    with SessionLocal() as refresh_session:
+        await asyncio.to_thread(bulk_refresh_product_variants, refresh_session, refresh_data)
+        refreshed_products, _ = await asyncio.to_thread(
+            read_products_from_db, [data["source_url"] for data in refresh_data], session=refresh_session
+        )
+    return refreshed_products
+
 async def scrape_sites(user_criteria: SearchPayload, update_status: UpdateStatusCallable):
     start_time = time.perf_counter()
     browser_config = BrowserConfig(
@@ -294,7 +321,12 @@ async def scrape_sites(user_criteria: SearchPayload, update_status: UpdateStatus
         await update_status(TaskStatus.COMPLETE, SubStatus.SUCCESS, data=[])
         return
     
-    cached_products, urls_to_scrape = read_products_from_db(urls_to_process)
+    with SessionLocal() as cache_check_session:
+        cached_products, urls_to_scrape = await asyncio.to_thread(
+            read_products_from_db, urls_to_process, session=cache_check_session
+        )
+        # stale URLs of known variants only need a new price and availability, not the LLM
+        urls_to_refresh = await asyncio.to_thread(get_known_variant_content_hashes, cache_check_session, urls_to_scrape)
     if cached_products:
         print(f"Sending {len(cached_products)} cached products to the client.")
         await update_status(
@@ -303,6 +335,25 @@ async def scrape_sites(user_criteria: SearchPayload, update_status: UpdateStatus
             data=cached_products
         )
 
+    if urls_to_refresh:
+        print(f"Refreshing prices and availability of {len(urls_to_refresh)} known products...")
+        await update_status(TaskStatus.SCRAPING, SubStatus.REFRESHING_PRICES, count=len(urls_to_refresh))
+
+        refreshed_products = await refresh_known_variants(urls_to_refresh, browser_config, config, dispatcher)
+        urls_to_scrape = [url for url in urls_to_scrape if url not in urls_to_refresh]
+        if refreshed_products:
+            # the client replaces its results on every update, so the cached products are sent again with them
+            refreshed_product_ids = {product.id for product in refreshed_products}
+            cached_products = [
+                product for product in cached_products if product.id not in refreshed_product_ids
+            ] + refreshed_products
+            print(f"Sending {len(cached_products)} cached and refreshed products to the client.")
+            await update_status(
+                TaskStatus.SCRAPING,
+                SubStatus.SENDING_CACHED_RESULTS,
+                data=cached_products
+            )
+
     if urls_to_scrape:
         print(f"Starting scraping for {len(urls_to_scrape)} URLs...")
 
@@ -311,7 +362,7 @@ async def scrape_sites(user_criteria: SearchPayload, update_status: UpdateStatus
         all_scraped_data: list[dict[str, any]] = []
         with SessionLocal() as db_check_session:
             print(f"Checking database for existing schema for category: '{user_selected_category}'...")
-            db_schema = get_schema_by_product_category(db_check_session, user_selected_category)
+            db_schema = await asyncio.to_thread(get_schema_by_product_category, db_check_session, user_selected_category)
 
         if db_schema:
             print(" Schema found in database. Entering high-speed 'Extraction-Only' mode for all URLs.")
@@ -362,7 +413,7 @@ async def scrape_sites(user_criteria: SearchPayload, update_status: UpdateStatus
             await update_status(TaskStatus.SCRAPING, SubStatus.EXTRACTING_DATA, count=len(urls_for_concurrent_extraction))
 
             async with AsyncWebCrawler(config=browser_config) as crawler:
-                async def scrape_site_task():
+                async def scrape_site_task(result: CrawlResult):
                     with SessionLocal() as session:
                         return await process_single_crawled_and_scraped_result(result, session, universal_schema_dict)
 
@@ -370,7 +421,8 @@ async def scrape_sites(user_criteria: SearchPayload, update_status: UpdateStatus
                 async for result in await crawler.arun_many(urls=urls_for_concurrent_extraction, config=config, dispatcher=dispatcher):
                     result: CrawlResult
                     print(f"Scrape completed for: {result.url}")
-                    tasks.append(asyncio.create_task(scrape_site_task()))
+                    # the result is passed in, as the tasks now run while the loop moves on to the next one
+                    tasks.append(asyncio.create_task(scrape_site_task(result)))
 
                 remaining_scraped_data = [res for res in await asyncio.gather(*tasks) if res is not None]
                 all_scraped_data.extend(remaining_scraped_data)
@@ -0,0 +1,5 @@
+import os
+
+# the db modules build their engines at import time; nothing here connects to a database
+for name, value in {"DB_HOST": "localhost", "DB_PORT": "5432", "DB_NAME": "crawlitics", "DB_USER": "postgres", "DB_PASSWORD": ""}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,30 @@
+import pytest
+from sqlalchemy.dialects.postgresql import asyncpg, psycopg2
+
+from db import search
+from db.crud import build_search_estimate_stmt, build_search_products_stmts
+
+@pytest.fixture
+def trigram_search(monkeypatch):
+    monkeypatch.setattr(search, "trigram_search_enabled", True)
+
+def test_estimate_keeps_trigram_operator_on_asyncpg(trigram_search):
+    compiled = build_search_estimate_stmt("phone").compile(dialect=asyncpg.dialect())
+    sql = str(compiled)
+    assert sql.startswith("EXPLAIN (FORMAT JSON) SELECT")
+    assert "products.search_text %> $" in sql
+    assert "%%" not in sql
+    assert "%phone%" in compiled.params.values()
+
+def test_estimate_keeps_trigram_operator_on_psycopg2(trigram_search):
+    compiled = build_search_estimate_stmt("phone").compile(dialect=psycopg2.dialect())
+    # psycopg2 interpolates pyformat parameters, which turns the escaped %% back into %
+    sql = compiled.string % {name: f"'{value}'" for name, value in compiled.params.items()}
+    assert "products.search_text %> 'phone'" in sql
+    assert "ILIKE '%phone%'" in sql
+
+@pytest.mark.parametrize("sort", ["price-asc", "price-desc"])
+def test_price_sort_counts_only_priced_products(sort):
+    count_stmt, page_stmt = build_search_products_stmts(sort=sort, cursor="")
+    assert "products.min_current_price IS NOT NULL" in str(count_stmt.compile(dialect=psycopg2.dialect()))
+    assert "products.min_current_price IS NOT NULL" in str(page_stmt.compile(dialect=psycopg2.dialect()))
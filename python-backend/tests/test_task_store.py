@@ -0,0 +1,35 @@
+from helpers.task_store import InMemoryTaskStore, merge_task_products
+
+def test_changed_products_bump_seq():
+    products, changed_products, seq = merge_task_products({}, [{"id": 1, "price": 10}])
+    assert products == [{"id": 1, "price": 10}]
+    assert changed_products == [{"id": 1, "price": 10}]
+    assert seq == 1
+
+def test_unchanged_update_keeps_seq():
+    previous_state = {"seq": 1, "data": [{"id": 1, "price": 10}]}
+    products, changed_products, seq = merge_task_products(previous_state, [{"id": 1, "price": 10}])
+    assert products == [{"id": 1, "price": 10}]
+    assert changed_products == []
+    assert seq == 1
+
+def test_update_merges_into_snapshot():
+    previous_state = {"seq": 3, "data": [{"id": 1, "price": 10}, {"id": 2, "price": 20}]}
+    products, changed_products, seq = merge_task_products(previous_state, [{"id": 2, "price": 15}, {"id": 3, "price": 30}])
+    assert products == [{"id": 1, "price": 10}, {"id": 2, "price": 15}, {"id": 3, "price": 30}]
+    assert changed_products == [{"id": 2, "price": 15}, {"id": 3, "price": 30}]
+    assert seq == 4
+
+def test_versions_keep_increasing_after_eviction():
+    store = InMemoryTaskStore(max_entries=1)
+    first = store.set("a", {"status": "RUNNING"})
+    store.set("b", {"status": "RUNNING"})
+    assert store.get("a") is None
+    assert store.set("a", {"status": "RUNNING"})["version"] > first["version"]
+
+def test_status_update_keeps_stored_products():
+    store = InMemoryTaskStore()
+    store.set("a", {"status": "SCRAPING"}, products={"seq": 1, "data": [{"id": 1}]})
+    record = store.set("a", {"status": "ANALYZING"})
+    assert "data" not in record["state"]
+    assert store.get("a")["state"] == {"status": "ANALYZING", "seq": 1, "data": [{"id": 1}]}